@@ -0,0 +1,85 @@
+'''
+Benchmark suite of the whole cascade trace on a synthetic fabric (deviceBackend.SyntheticBackend), no network needed.
+
+Every scenario runs showCountersCascade.py in a fresh process (in a temporary directory, where the reports are
+written) and reports end-to-end trace time, RPCs sent to the devices and peak memory (max RSS) of the process.
+
+Usage: python benchmarks/bench_cascade.py [--spec SPEC] [--latency SECONDS] [--connect-latency SECONDS]
+'''
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "showCountersCascade.py")
+sys.path.insert(0, ROOT)
+from deviceBackend import SyntheticFabric
+
+# (name, extra options of the script, True to trace every host of the fabric instead of the first one, None for no
+# target)
+SCENARIOS = (
+    ("single", [], False),
+    ("single --parallel", ['--parallel'], False),
+    ("single --filtered", ['--filtered'], False),
+    ("single --parallel --filtered", ['--parallel', '--filtered'], False),
+    ("single --all-branches", ['--all-branches'], False),
+    ("batch", ['--combined'], True),
+    ("batch --parallel", ['--combined', '--parallel'], True),
+    ("batch --all-branches", ['--combined', '--all-branches'], True),
+    ("sweep (no target)", ['--sweep'], None),
+)
+
+
+def run(options, targets, directory):
+    '''
+    :param options: list of options (string) of the script
+    :param targets: list of target IPs (string), passed via stdin
+    :param directory: working directory of the script
+    :return: tuple (seconds, RPCs sent, max RSS in MB)
+    '''
+    with tempfile.TemporaryFile() as output:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, SCRIPT, '--targets', '-'] + options, cwd=directory,
+                                   stdin=subprocess.PIPE, stdout=output, stderr=subprocess.STDOUT)
+        process.stdin.write(("\n".join(targets) + "\n").encode())
+        process.stdin.close()
+        pid, status, usage = os.wait4(process.pid, 0)  # rusage of this process only
+        process.returncode = os.waitstatus_to_exitcode(status)
+        seconds = time.perf_counter() - start
+        output.seek(0)
+        text = output.read().decode()
+    if process.returncode != 0:
+        raise RuntimeError("showCountersCascade.py " + " ".join(options) + " failed:\n" + text)
+    rpc = re.search(r"RPC snapshot: (\d+) RPC sent", text)
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / 1024 / 1024
+    return seconds, int(rpc.group(1)) if rpc else -1, rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the cascade on a synthetic fabric")
+    parser.add_argument('--spec', default="tiers=3,fanout=2,hosts=4,macs=10000,arp=10000,lacp=4,config=2000")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds of every RPC")
+    parser.add_argument('--connect-latency', type=float, default=0.2, help="seconds of every connection")
+    args = parser.parse_args()
+
+    fabric = SyntheticFabric.from_spec(args.spec)
+    common = ['--synthetic', args.spec, '--latency', str(args.latency), '--connect-latency',
+              str(args.connect_latency), '--core', fabric.core(), '--user', 'benchmark']
+    print("fabric: " + args.spec + ", RPC latency " + str(args.latency) + " s, connect latency " +
+          str(args.connect_latency) + " s")
+    print("%-32s %8s %10s %8s %10s" % ("scenario", "targets", "time [s]", "RPCs", "RSS [MB]"))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, options, batch in SCENARIOS:
+            targets = fabric.targets() if batch else fabric.targets()[:1] if batch is False else []
+            seconds, rpc, rss = run(common + options, targets, directory)
+            print("%-32s %8d %10.2f %8d %10.1f" % (name, len(targets), seconds, rpc, rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''
+Benchmark: batched counter collection of an aggregate and its LACP members against one RPC per interface.
+
+A fake device answers get_interface_information after a fixed latency (the round trip of a real device), the script
+counts the round trips and measures the wall time of both paths for bundles of 1 to 8 members.
+
+Usage: python benchmarks/bench_intBatch.py [latency in seconds]
+'''
+
+import os
+import sys
+import time
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from intCounters import collect_intInfo, get_intCounters, parse_intInfo
+from rpcSnapshot import invalidate_snapshot
+
+
+def make_interface(name):
+    '''
+    :param name: interface name (string)
+    :return: physical-interface element with some extensive counters
+    '''
+    phy = etree.Element('physical-interface')
+    etree.SubElement(phy, 'name').text = name
+    errors = etree.SubElement(phy, 'input-error-list')
+    for counter in ('input-errors', 'input-drops', 'framing-errors', 'input-runts', 'input-discards'):
+        etree.SubElement(errors, counter).text = '0'
+    errors = etree.SubElement(phy, 'output-error-list')
+    for counter in ('carrier-transitions', 'output-errors', 'output-drops', 'mtu-errors'):
+        etree.SubElement(errors, counter).text = '0'
+    return phy
+
+
+class FakeRpc:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def get_interface_information(self, interface_name, extensive=False):
+        self.calls += 1
+        time.sleep(self.latency)
+        names = interface_name if isinstance(interface_name, (list, tuple)) else [interface_name]
+        reply = etree.Element('interface-information')
+        for name in names:
+            reply.append(make_interface(name))
+        return reply
+
+
+class FakeDevice:
+    def __init__(self, latency):
+        self.rpc = FakeRpc(latency)
+
+
+def per_interface(device, interfaces):
+    '''
+    :return: dict name -> InterfaceCounters, one RPC per interface as the old save_intErrors did
+    '''
+    result = {}
+    for name in interfaces:
+        result.update(parse_intInfo(device.rpc.get_interface_information(interface_name=name, extensive=True)))
+    return result
+
+
+def batched(device, interfaces):
+    '''
+    :return: dict name -> InterfaceCounters, collected with intCounters
+    '''
+    collect_intInfo(device, interfaces)
+    result = {name: get_intCounters(device, name) for name in interfaces}
+    invalidate_snapshot(device)
+    return result
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    print("RPC latency: " + str(latency) + " s")
+    print("%8s %12s %12s %12s %12s" % ("members", "old RPCs", "old [s]", "batch RPCs", "batch [s]"))
+    for members in (1, 2, 4, 8):
+        interfaces = ['ae1'] + ['xe-0/0/%d' % n for n in range(members)]
+        results = []
+        for path in (per_interface, batched):
+            device = FakeDevice(latency)
+            start = time.perf_counter()
+            collected = path(device, interfaces)
+            results.append((device.rpc.calls, time.perf_counter() - start))
+            assert sorted(collected) == sorted(interfaces)
+        print("%8d %12d %12.3f %12d %12.3f" % (members, results[0][0], results[0][1], results[1][0], results[1][1]))
+
+
+if __name__ == '__main__':
+    main()
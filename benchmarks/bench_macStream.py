@@ -0,0 +1,88 @@
+'''
+Benchmark: lookup of one MAC in a big ethernet-switching table, whole tree + index (the path used with PyEZ replies)
+against the incremental parse of the raw reply that stops at the entry (tableIndex.stream_macIndex).
+
+The table is written to a temporary file, every measure runs in a fresh process that reads it, so the peak memory
+(max RSS) of each path is measured separately; "import only" is the RSS of a process that just loads the modules.
+
+Usage: python benchmarks/bench_macStream.py [entries]
+'''
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from deviceBackend import _MAC_ENTRY, _make_mac
+from tableIndex import build_macIndex, stream_macIndex
+
+
+def write_table(path, entries):
+    '''
+    :param path: path (string) of the file
+    :param entries: number of MAC entries
+    :return: None, the reply of get_ethernet_switching_table_information is written in the file
+    '''
+    with open(path, 'w') as file:
+        file.write("<l2ng-l2ng-mac-table><l2ng-mac-entry-db>")
+        for n in range(entries):
+            file.write(_MAC_ENTRY % (_make_mac(n), "ae%d.0" % (n % 48)))
+        file.write("</l2ng-mac-entry-db></l2ng-l2ng-mac-table>")
+
+
+def lookup(mode, path, mac):
+    '''
+    :return: seconds to find the logical interface of the MAC with the given mode, run in the child process
+    '''
+    from lxml import etree
+    start = time.perf_counter()
+    if mode == 'tree':
+        interface = build_macIndex(etree.parse(path).getroot()).get_interface(mac)
+    elif mode == 'stream':
+        with open(path, 'rb') as file:
+            interface = stream_macIndex(file, mac).get_interface(mac)
+    else:
+        interface = None
+    seconds = time.perf_counter() - start
+    return seconds, interface
+
+
+def measure(mode, path, mac):
+    '''
+    :return: tuple (seconds, max RSS in MB) of a child process doing the lookup
+    '''
+    process = subprocess.Popen([sys.executable, __file__, '--child', mode, path, mac], stdout=subprocess.PIPE)
+    output = process.stdout.read().decode()
+    pid, status, usage = os.wait4(process.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError("child " + mode + " failed")
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / 1024 / 1024
+    return float(output.split()[0]), rss
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        seconds, interface = lookup(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(seconds, interface)
+        return
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "mac.xml")
+        write_table(path, entries)
+        print("MAC table: " + str(entries) + " entries, " + str(os.path.getsize(path) // 1024) + " KB")
+        print("%-16s %-14s %12s %10s" % ("MAC position", "path", "time [ms]", "RSS [MB]"))
+        seconds, rss = measure('none', path, "")
+        print("%-16s %-14s %12s %10.1f" % ("-", "import only", "-", rss))
+        for position, mac in (("first", _make_mac(0)), ("middle", _make_mac(entries // 2)),
+                              ("last", _make_mac(entries - 1)), ("missing", _make_mac(entries))):
+            for mode in ('tree', 'stream'):
+                seconds, rss = measure(mode, path, mac)
+                print("%-16s %-14s %12.1f %10.1f" % (position, mode, seconds * 1000, rss))
+
+
+if __name__ == '__main__':
+    main()
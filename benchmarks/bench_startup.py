@@ -0,0 +1,79 @@
+'''
+Benchmark of the fixed cost of a trace: start of the script and of a trace when a scheduler launches many of them.
+
+- import: fresh process that only imports showCountersCascade (PyEZ is loaded when the first device is contacted).
+- --help: fresh process that parses the command line and exits.
+- CLI: one process per target, each one tracing a single target on a synthetic fabric and writing its report.
+- API: one process, one Cascade object, the targets are traced one after another with Cascade.trace (sessions reused).
+
+Usage: python benchmarks/bench_startup.py [--spec SPEC] [--traces N] [--connect-latency SECONDS]
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "showCountersCascade.py")
+sys.path.insert(0, ROOT)
+
+
+def run(command, directory, stdin=b""):
+    '''
+    :param command: list of the arguments of the process
+    :param directory: working directory of the process
+    :param stdin: bytes written to the standard input
+    :return: seconds until the process exits
+    '''
+    start = time.perf_counter()
+    subprocess.run(command, cwd=directory, input=stdin, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def best(function, repeat=5):
+    '''
+    :return: the lowest of repeat calls of function
+    '''
+    return min(function() for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup and per-trace cost of the CLI and of the library API")
+    parser.add_argument('--spec', default="tiers=3,fanout=2,hosts=4,macs=1000,arp=1000,lacp=2,config=200")
+    parser.add_argument('--traces', type=int, default=20, help="targets traced, one per CLI process")
+    parser.add_argument('--connect-latency', type=float, default=0.05, help="seconds of every connection")
+    args = parser.parse_args()
+
+    from deviceBackend import make_backend
+    from showCountersCascade import Cascade
+    backend = make_backend(synthetic=args.spec, connect_latency=args.connect_latency)
+    fabric = backend.fabric
+    targets = (fabric.targets() * args.traces)[:args.traces]
+    options = ['--synthetic', args.spec, '--connect-latency', str(args.connect_latency), '--core', fabric.core(),
+               '--user', 'benchmark', '--targets', '-']
+    print("fabric: " + args.spec + ", connect latency " + str(args.connect_latency) + " s, " + str(len(targets)) +
+          " traces")
+    print("%-28s %12s %14s" % ("step", "total [s]", "per trace [ms]"))
+    with tempfile.TemporaryDirectory() as directory:
+        seconds = best(lambda: run([sys.executable, '-c', 'import showCountersCascade'], ROOT))
+        print("%-28s %12.3f %14s" % ("import", seconds, "-"))
+        seconds = best(lambda: run([sys.executable, SCRIPT, '--help'], directory))
+        print("%-28s %12.3f %14s" % ("--help", seconds, "-"))
+        start = time.perf_counter()
+        for target in targets:
+            run([sys.executable, SCRIPT] + options, directory, (target + "\n").encode())
+        seconds = time.perf_counter() - start
+        print("%-28s %12.3f %14.1f" % ("CLI, a process per trace", seconds, seconds * 1000 / len(targets)))
+        start = time.perf_counter()
+        with Cascade(fabric.core(), 'benchmark', backend=backend, verbose=False) as cascade:
+            for target in targets:
+                cascade.trace([target])
+        seconds = time.perf_counter() - start
+        print("%-28s %12.3f %14.1f" % ("API, one Cascade", seconds, seconds * 1000 / len(targets)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+Micro-benchmark: hash indexes of tableIndex.py against the linear XML scan used before.
+
+Synthetic ARP and ethernet-switching tables of 1k, 10k and 100k entries are generated, then the same lookups are
+resolved by scanning the tree (old path) and by the indexes (build once + O(1) lookups).
+
+Usage: python benchmarks/bench_tableIndex.py [lookups]
+'''
+
+import os
+import sys
+import time
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tableIndex import build_arpIndex, build_macIndex
+
+SIZES = (1000, 10000, 100000)
+
+
+def make_mac(n):
+    '''
+    :param n: integer
+    :return: MAC (string) built from the integer
+    '''
+    return ':'.join('%02x' % b for b in n.to_bytes(6, 'big'))
+
+
+def make_ip(n):
+    '''
+    :param n: integer
+    :return: IPv4 address (string) in 10.0.0.0/8 built from the integer
+    '''
+    return '10.%d.%d.%d' % ((n >> 16) & 255, (n >> 8) & 255, n & 255)
+
+
+def make_tables(size):
+    '''
+    :param size: number of entries of the tables
+    :return: tuple (ARP reply, ethernet-switching reply) as lxml Elements
+    '''
+    arp = etree.Element('arp-table-information')
+    mac = etree.Element('l2ng-l2ng-mac-table')
+    db = etree.SubElement(mac, 'l2ng-mac-entry-db')  # entries are nested, as on the devices
+    for n in range(size):
+        entry = etree.SubElement(arp, 'arp-table-entry')
+        etree.SubElement(entry, 'mac-address').text = make_mac(n)
+        etree.SubElement(entry, 'ip-address').text = make_ip(n)
+        entry = etree.SubElement(db, 'l2ng-mac-entry')
+        etree.SubElement(entry, 'l2ng-l2-mac-address').text = make_mac(n)
+        etree.SubElement(entry, 'l2ng-l2-mac-logical-interface').text = 'ae%d.0' % (n % 48)
+    return arp, mac
+
+
+def scan_lookup(showArp, showmac, target):
+    '''
+    :return: physical interface (string) of target, resolved scanning the XML trees as the old code did
+    '''
+    mac_target = None
+    for i in showArp.xpath('arp-table-entry'):
+        if (i.findtext('ip-address')) == target:
+            mac_target = i.findtext('mac-address')
+    for p in showmac.iter('l2ng-mac-entry'):
+        if (p.findtext('l2ng-l2-mac-address')) == mac_target:
+            return (p.findtext('l2ng-l2-mac-logical-interface')).split('.')[0]
+
+
+def index_lookup(arp, macs, target):
+    '''
+    :return: physical interface (string) of target, resolved with the indexes
+    '''
+    return macs.get_interface(arp.get(target)).split('.')[0]
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print("%8s %8s %12s %12s %12s %10s" % ("entries", "lookups", "scan [s]", "build [s]", "index [s]", "speedup"))
+    for size in SIZES:
+        showArp, showmac = make_tables(size)
+        # spread the targets over the table, the scan cost depends on the position of the entry
+        targets = [make_ip((size - 1) * k // max(lookups - 1, 1)) for k in range(lookups)]
+
+        start = time.perf_counter()
+        expected = [scan_lookup(showArp, showmac, t) for t in targets]
+        scan_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        arp = build_arpIndex(showArp)
+        macs = build_macIndex(showmac)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        result = [index_lookup(arp, macs, t) for t in targets]
+        index_time = time.perf_counter() - start
+
+        assert result == expected
+        print("%8d %8d %12.4f %12.4f %12.6f %9.1fx" % (size, lookups, scan_time, build_time, index_time,
+                                                       scan_time / (build_time + index_time)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+'''
+Sampling of the interface counters found on the path (--samples/--interval).
+
+Once the trace is over the path is known: the devices and the interfaces (aggregates and LACP members) towards the
+targets. The sampler keeps a session per device and reads only the counters of those interfaces, N times at a fixed
+interval (no ARP/MAC/LLDP lookups between the samples, so the interval stays accurate), then reports for every counter
+that changed the delta over the window, its rate per second and whether it's still incrementing.
+
+Each sample is one flat array of floats (interface rows x FIELDS of intCounters, NaN where the device doesn't return
+the counter), the deltas of all the counters are computed in one pass over the arrays.
+'''
+
+import math
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from intCounters import COUNTER_SCHEMA, FIELDS, collect_intInfo, get_intCounters
+from rpcSnapshot import get_snapshot
+
+_WIDTH = len(FIELDS)
+_NAN = float('nan')
+
+
+def _labels():
+    '''
+    :return: tuple with the label of every field of FIELDS, prefixed by the section when the label isn't unique
+    '''
+    counters = [(tag, c[2]) for header, tag, fields in COUNTER_SCHEMA for c in fields]
+    names = [label for tag, label in counters]
+    return tuple(label if names.count(label) == 1 else tag + " " + label for tag, label in counters)
+
+
+LABELS = _labels()
+
+
+def to_float(value):
+    '''
+    :param value: counter of an InterfaceCounters record (integer, string or None)
+    :return: the counter as float, NaN if missing or not a number
+    '''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return _NAN
+
+
+def to_array(record):
+    '''
+    :param record: InterfaceCounters record
+    :return: array('d') with its counters in the order of FIELDS, NaN where missing
+    '''
+    return array('d', map(to_float, record.values))
+
+
+def counter_changes(before, after, seconds):
+    '''
+    :param before: array('d') of the counters of an interface (see to_array)
+    :param after: array('d') of the same counters read later
+    :param seconds: seconds between the two readings
+    :return: list of tuples (label, delta, rate per second) of the counters that changed
+    '''
+    changes = []
+    for field, delta in enumerate(b - a for a, b in zip(before, after)):
+        if not math.isnan(delta) and delta != 0:
+            changes.append((LABELS[field], delta, delta / seconds if seconds > 0 else 0.0))
+    return changes
+
+
+class CounterSamples:
+    '''
+    Samples of the counters of the interfaces on the path
+    '''
+
+    def __init__(self, path, interval=None):
+        '''
+        :param path: list of tuples (mgmt IP, hostname, list of interface names) of the devices on the path
+        :param interval: seconds between two samples, only written in the report
+        '''
+        self.interval = interval
+        self.rows = []  # (mgmt IP, interface) of every row of the arrays
+        self.hostnames = {}
+        self.interfaces = {}  # mgmt IP -> list of interface names, in row order
+        for ip, hostname, names in path:
+            self.hostnames.setdefault(ip, hostname)
+            known = self.interfaces.setdefault(ip, [])
+            for name in names:
+                if name not in known:
+                    known.append(name)
+                    self.rows.append((ip, name))
+        self.row_index = {row: n for n, row in enumerate(self.rows)}
+        self.values = []  # one array('d') per sample, len(rows) * _WIDTH
+        self.times = []  # one dict mgmt IP -> time.monotonic() of the reply per sample
+
+    def add(self, counters):
+        '''
+        :param counters: dict mgmt IP -> tuple (time of the reply, dict interface -> InterfaceCounters), a device
+                         missing from the dict (e.g. unreachable) has NaN counters in the sample
+        '''
+        sample = array('d', [_NAN]) * (len(self.rows) * _WIDTH)
+        for ip, (when, records) in counters.items():
+            for name, record in records.items():
+                row = self.row_index.get((ip, name))
+                if row is not None:
+                    sample[row * _WIDTH:(row + 1) * _WIDTH] = to_array(record)
+        self.values.append(sample)
+        self.times.append({ip: counters[ip][0] for ip in counters})
+
+    def deltas(self):
+        '''
+        :return: tuple (total, last): arrays with the difference of every counter between the last and the first
+                 sample and between the last two samples (NaN where a counter is missing)
+        '''
+        first, previous, last = self.values[0], self.values[-2], self.values[-1]
+        return array('d', (b - a for a, b in zip(first, last))), array('d', (b - a for a, b in zip(previous, last)))
+
+    def seconds(self, ip):
+        '''
+        :param ip: mgmt IP (string) of a device
+        :return: seconds between the first and the last sample of the device, None if one of them is missing
+        '''
+        if ip not in self.times[0] or ip not in self.times[-1]:
+            return None
+        return self.times[-1][ip] - self.times[0][ip]
+
+    def render(self, path=None):
+        '''
+        :param path: same as __init__, only its devices and interfaces are written; every row if None
+        :return: text (string) with the counters that changed during the sampling, per device and interface
+        '''
+        lines = ["", "Counter sampling: " + str(len(self.values)) + " samples" +
+                 (" every " + str(self.interval) + " s" if self.interval is not None else "")]
+        if len(self.values) < 2:
+            return "\n".join(lines + ["\tnot enough samples to compute the rates"]) + "\n"
+        total, last = self.deltas()
+        rows = self.rows
+        if path is not None:
+            wanted = {(ip, name) for ip, hostname, names in path for name in names}
+            rows = [row for row in rows if row in wanted]
+        for ip, name in rows:
+            seconds = self.seconds(ip)
+            lines.append(self.hostnames.get(ip, ip) + "(" + ip + ") " + name)
+            if seconds is None:
+                lines.append("\tnot sampled, the device didn't answer at the start or at the end of the window")
+                continue
+            offset = self.row_index[(ip, name)] * _WIDTH
+            changed = 0
+            for field in range(_WIDTH):
+                delta = total[offset + field]
+                if math.isnan(delta) or delta == 0:
+                    continue
+                changed += 1
+                rate = delta / seconds if seconds > 0 else 0.0
+                lines.append("\t" + LABELS[field] + ": " + "%+d" % delta + " in " + "%.1f" % seconds + " s (" +
+                             "%.3f" % rate + "/s)" + (", still incrementing" if last[offset + field] > 0 else ""))
+            if changed == 0:
+                lines.append("\tno counter changed in " + "%.1f" % seconds + " s")
+        return "\n".join(lines) + "\n"
+
+
+def read_counters(device, interfaces):
+    '''
+    :param device: jnpr.junos Device object already opened
+    :param interfaces: list of interface names (string)
+    :return: tuple (time.monotonic() of the reply, dict interface -> InterfaceCounters), read from the device now
+    '''
+    snapshot = get_snapshot(device)
+    snapshot.invalidate('get_interface_information')  # the counters of the previous sample are stale
+    collect_intInfo(device, interfaces)
+    records = {name: get_intCounters(device, name) for name in interfaces}
+    return time.monotonic(), records
+
+
+def _read(device, interfaces):
+    try:
+        return read_counters(device, interfaces)
+    except Exception:  # the device is missing from this sample, the others go on
+        return None
+
+
+def sample_counters(path, samples, interval, acquire, release):
+    '''
+    :param path: same as CounterSamples
+    :param samples: number (integer) of samples
+    :param interval: seconds between two samples
+    :param acquire: function mgmt IP -> opened device, None if it wasn't possible to connect
+    :param release: function device -> None, called at the end for every device
+    :return: CounterSamples object
+    '''
+    result = CounterSamples(path, interval)
+    devices = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(result.interfaces)))) as executor:
+        for ip, device in zip(result.interfaces, executor.map(acquire, result.interfaces)):
+            if device is not None:
+                devices[ip] = device
+        try:
+            start = time.monotonic()
+            for n in range(samples):
+                # the samples are scheduled from the start, the time spent reading doesn't shift the following ones
+                time.sleep(max(0.0, start + n * interval - time.monotonic()))
+                replies = executor.map(lambda ip: _read(devices[ip], result.interfaces[ip]), devices)
+                result.add({ip: reply for ip, reply in zip(devices, replies) if reply is not None})
+        finally:
+            for device in devices.values():
+                release(device)
+    return result
@@ -0,0 +1,522 @@
+'''
+Pluggable device backends: the objects that stand in for jnpr.junos Device when connecting to a management IP.
+
+- JunosBackend: real devices through PyEZ (the default), with rpc_stream reading the raw ncclient reply.
+- RecordBackend: devices of another backend (real ones), every RPC reply is also saved as XML under <directory>/<ip>/.
+- ReplayBackend: serves the replies saved by RecordBackend, no network needed.
+- SyntheticBackend: generates an N-tier MC-LAG fabric with configurable MAC/ARP table sizes, LACP widths and latency.
+
+Each backend has device(ip, user, password), returning an object with open(), close(), facts['hostname'] and the
+rpc.<name>(**kwargs) methods used by the script. The real, replayed and synthetic devices also have rpc_stream(name,
+**kwargs), returning the raw reply as a binary file object instead of the parsed tree, their backends have streams set
+to True. make_backend builds the backend from the options of the command line.
+'''
+
+import functools
+import hashlib
+import io
+import json
+import os
+import time
+from lxml import etree
+
+
+def rpc_filename(name, kwargs):
+    '''
+    :param name: name (string) of the rpc
+    :param kwargs: dict with the arguments of the rpc
+    :return: file name (string) of the saved reply, the arguments are hashed so each call has its own file
+    '''
+    if len(kwargs) == 0:
+        return name + ".xml"
+    arguments = json.dumps(sorted((k, list(v) if isinstance(v, tuple) else v) for k, v in kwargs.items()),
+                           default=str)
+    return name + "-" + hashlib.sha1(arguments.encode()).hexdigest()[:12] + ".xml"
+
+
+class JunosBackend:
+    '''
+    Real devices, via jnpr.junos
+    '''
+    needs_credentials = True
+    streams = True
+
+    def device(self, ip, user, password):
+        from jnpr.junos import Device
+        # facts are gathered lazily, only the ones read (the hostname) cost an RPC
+        device = Device(host=ip, user=user, password=password, port=22, gather_facts=False)
+        device.rpc_stream = functools.partial(junos_rpc_stream, device)
+        return device
+
+
+def junos_rpc_stream(device, name, **kwargs):
+    '''
+    :param device: jnpr.junos Device object already opened
+    :param name: name (string) of the PyEZ rpc method
+    :param kwargs: arguments of the rpc (strings or True), as for device.rpc.<name>
+    :return: the raw reply as a binary file object, None if the device answered with an rpc-error (the rpc is asked
+             again through PyEZ, which raises or ignores it); the reply is taken from ncclient as received, before the
+             parse, the removal of the namespaces and the normalization that build three trees of the whole table
+    '''
+    rpc = etree.Element(name.replace('_', '-'))  # the same rpc built by device.rpc.<name>
+    for key, value in kwargs.items():
+        argument = etree.SubElement(rpc, key.replace('_', '-'))
+        if value is not True:
+            argument.text = value
+    manager = device._conn
+    manager.async_mode = True  # the synchronous call parses the reply before returning it
+    try:
+        operation = manager.rpc(rpc)
+    finally:
+        manager.async_mode = False
+    if operation.event.wait(manager.timeout) is False:
+        from ncclient.operations.errors import TimeoutExpiredError
+        raise TimeoutExpiredError("no reply to " + name + " from " + device.hostname)
+    if operation.error is not None:
+        raise operation.error
+    raw = operation.reply.xml
+    if "<rpc-error" in raw:
+        return None
+    return io.BytesIO(raw.encode())
+
+
+class _RecordingRpc:
+    def __init__(self, rpc, directory):
+        self._rpc = rpc
+        self._directory = directory
+
+    def __getattr__(self, name):
+        method = getattr(self._rpc, name)
+
+        def call(**kwargs):
+            reply = method(**kwargs)
+            with open(os.path.join(self._directory, rpc_filename(name, kwargs)), 'wb') as file:
+                file.write(etree.tostring(reply))
+            return reply
+        return call
+
+
+class RecordingDevice:
+    '''
+    Real device whose replies are saved as they arrive
+    '''
+
+    def __init__(self, device, directory):
+        '''
+        :param device: jnpr.junos Device object (or a device of another backend)
+        :param directory: directory (string) of the device replies
+        '''
+        self._device = device
+        self._directory = directory
+        self.rpc = _RecordingRpc(device.rpc, directory)
+
+    @property
+    def facts(self):
+        return self._device.facts
+
+    @property
+    def connected(self):
+        return self._device.connected
+
+    def open(self, **kwargs):
+        self._device.open(**kwargs)
+        os.makedirs(self._directory, exist_ok=True)
+        with open(os.path.join(self._directory, "facts.json"), 'w') as file:
+            json.dump({'hostname': self._device.facts['hostname']}, file)
+        return self
+
+    def close(self):
+        self._device.close()
+
+
+class RecordBackend:
+    '''
+    Devices of another backend (normally real ones), every reply is saved under <directory>/<ip>/ to be replayed later
+    '''
+    streams = False  # the replies are recorded from the parsed tree
+
+    def __init__(self, directory, source):
+        '''
+        :param directory: directory (string) where the replies are saved
+        :param source: backend of the devices that are recorded
+        '''
+        self.directory = directory
+        self.source = source
+        self.needs_credentials = source.needs_credentials
+
+    def device(self, ip, user, password):
+        return RecordingDevice(self.source.device(ip, user, password), os.path.join(self.directory, ip))
+
+
+class _ReplayRpc:
+    def __init__(self, device):
+        self._device = device
+
+    def __getattr__(self, name):
+        def call(**kwargs):
+            return self._device.reply(name, kwargs)
+        return call
+
+
+class ReplayDevice:
+    '''
+    Device that answers with the replies saved by RecordBackend (or generated by SyntheticBackend)
+    '''
+
+    def __init__(self, ip, directory, latency=0.0, connect_latency=0.0):
+        '''
+        :param ip: management IP (string)
+        :param directory: directory (string) with the replies of the device
+        :param latency: seconds waited for each rpc, to simulate the round trip of a real device
+        :param connect_latency: seconds waited by open(), to simulate SSH + NETCONF handshake
+        '''
+        self.ip = ip
+        self.hostname = ip  # used by the PyEZ exceptions
+        self.directory = directory
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.facts = {}
+        self.connected = False
+        self.rpc = _ReplayRpc(self)
+
+    def open(self, **kwargs):
+        path = os.path.join(self.directory, "facts.json")
+        if not os.path.exists(path):
+            from jnpr.junos.exception import ConnectError
+            raise ConnectError(self, "no replies recorded for " + self.ip)
+        time.sleep(self.connect_latency)
+        with open(path) as file:
+            self.facts = json.load(file)
+        self.connected = True
+        return self
+
+    def close(self):
+        self.connected = False
+
+    def reply(self, name, kwargs):
+        '''
+        :return: the saved reply of the rpc, RpcError if it wasn't recorded (e.g. a filter never used while recording,
+                 so the script falls back to the full table as with a device that rejects the filter)
+        '''
+        time.sleep(self.latency)
+        path = os.path.join(self.directory, rpc_filename(name, kwargs))
+        if not os.path.exists(path):
+            from jnpr.junos.exception import RpcError
+            raise RpcError(cmd=name)
+        return etree.parse(path).getroot()
+
+    def rpc_stream(self, name, **kwargs):
+        '''
+        :return: the saved reply of the rpc as a binary file object, RpcError if it wasn't recorded
+        '''
+        time.sleep(self.latency)
+        path = os.path.join(self.directory, rpc_filename(name, kwargs))
+        if not os.path.exists(path):
+            from jnpr.junos.exception import RpcError
+            raise RpcError(cmd=name)
+        return open(path, 'rb')
+
+
+class ReplayBackend:
+    '''
+    Devices replayed from a directory written by RecordBackend
+    '''
+    needs_credentials = False
+    streams = True
+
+    def __init__(self, directory, latency=0.0, connect_latency=0.0):
+        self.directory = directory
+        self.latency = latency
+        self.connect_latency = connect_latency
+
+    def device(self, ip, user, password):
+        return ReplayDevice(ip, os.path.join(self.directory, ip), self.latency, self.connect_latency)
+
+
+_ARP_ENTRY = ("<arp-table-entry><mac-address>%s</mac-address><ip-address>%s</ip-address>"
+              "<interface-name>irb.100</interface-name></arp-table-entry>")
+_MAC_ENTRY = ("<l2ng-mac-entry><l2ng-l2-mac-vlan-name>v100</l2ng-l2-mac-vlan-name><l2ng-l2-mac-address>%s"
+              "</l2ng-l2-mac-address><l2ng-l2-mac-logical-interface>%s</l2ng-l2-mac-logical-interface>"
+              "</l2ng-mac-entry>")
+
+
+def _make_mac(n):
+    return ':'.join('%02x' % b for b in (0x020000000000 + n).to_bytes(6, 'big'))
+
+
+class SyntheticFabric:
+    '''
+    N-tier fabric of MC-LAG pairs: tier 0 is the core pair (where the ARP of the hosts resides), every pair has fanout
+    child pairs connected through an aggregate of lacp members, the pairs of the last tier have the hosts.
+    '''
+
+    def __init__(self, tiers=3, fanout=2, hosts=4, macs=1000, arp=1000, lacp=2, config=200):
+        '''
+        :param tiers: number of tiers (core included)
+        :param fanout: child pairs of each pair
+        :param hosts: hosts under each pair of the last tier
+        :param macs: filler entries of every MAC table (MACs of other hosts of the fabric)
+        :param arp: filler entries of the core ARP table
+        :param lacp: members of every aggregate
+        :param config: filler interface stanzas of every configuration (its size matters only without filters)
+        '''
+        self.tiers = tiers
+        self.fanout = fanout
+        self.hosts = hosts
+        self.macs = macs
+        self.arp = arp
+        self.lacp = lacp
+        self.config = config
+        self._replies = {}  # ip -> dict of serialized replies, built on first use
+        self._filler = None  # (ARP entries, MAC entries) shared by every device
+        self.start = time.monotonic()  # the error counters of some interfaces grow from here
+        self._locations = {}  # ip -> (tier, pair, side)
+        for tier in range(tiers):
+            for pair in range(fanout ** tier):
+                for side in (0, 1):
+                    self._locations[self.ip(tier, pair, side)] = (tier, pair, side)
+
+    @staticmethod
+    def from_spec(spec):
+        '''
+        :param spec: string like "tiers=3,fanout=2,macs=10000" (missing keys keep the default)
+        :return: SyntheticFabric object
+        '''
+        kwargs = {}
+        for item in spec.split(','):
+            if item.strip() != "":
+                key, value = item.split('=')
+                kwargs[key.strip()] = int(value)
+        return SyntheticFabric(**kwargs)
+
+    def ip(self, tier, pair, side):
+        '''
+        :return: management IP (string) of side 0/1 of the pair (index within the tier) of the tier
+        '''
+        return "10.%d.%d.%d" % (tier, pair // 100, (pair % 100) * 2 + side + 1)
+
+    def core(self):
+        return self.ip(0, 0, 0)
+
+    def targets(self):
+        '''
+        :return: list of the host IPs (string), in the order of the leaf pairs
+        '''
+        leaves = self.fanout ** (self.tiers - 1)
+        return ["172.%d.%d.%d" % (16 + n // 65536, (n // 256) % 256, n % 256) for n in range(leaves * self.hosts)]
+
+    def _host_interface(self, tier, pair, host):
+        '''
+        :return: logical interface (string) where the device of tier/pair sees the host (index in targets())
+        '''
+        leaf = host // self.hosts
+        span = self.fanout ** (self.tiers - 1 - tier)  # leaf pairs under each pair of this tier
+        if leaf // span != pair:
+            return "ae0.0"  # uplink
+        if tier == self.tiers - 1:
+            return "ge-0/0/%d.0" % (host % self.hosts)
+        return "ae%d.0" % ((leaf % span) // (span // self.fanout) + 1)
+
+    def _build(self, ip):
+        tier, pair, side = self._locations.get(ip)
+        replies = {'hostname': "sw-t%d-p%d-%s" % (tier, pair, "ab"[side])}
+        targets = self.targets()
+
+        # the tables are written as text: the filler entries are the same on every device and are built once
+        if self._filler is None:
+            self._filler = (
+                "".join(_ARP_ENTRY % (_make_mac(1000000 + n), "10.200.%d.%d" % (n // 256, n % 256))
+                        for n in range(self.arp)),
+                "".join(_MAC_ENTRY % (_make_mac(2000000 + n), "ae0.0") for n in range(self.macs)))
+        arp_filler, mac_filler = self._filler
+        replies['arp_entries'] = {}
+        if tier == 0:
+            replies['arp_entries'] = {t: _make_mac(n) for n, t in enumerate(targets)}
+        replies['arp'] = ("<arp-table-information>" +
+                          "".join(_ARP_ENTRY % (mac, t) for t, mac in replies['arp_entries'].items()) +
+                          (arp_filler if tier == 0 else "") + "</arp-table-information>").encode()
+        replies['mac_entries'] = {_make_mac(n): self._host_interface(tier, pair, n) for n in range(len(targets))}
+        replies['mac'] = ("<l2ng-l2ng-mac-table><l2ng-mac-entry-db>" +
+                          "".join(_MAC_ENTRY % entry for entry in replies['mac_entries'].items()) + mac_filler +
+                          "</l2ng-mac-entry-db></l2ng-l2ng-mac-table>").encode()
+
+        lacp = etree.Element('lacp-interface-information-list')
+        lldp = {}
+        aggregates = [(0, ["et-0/0/%d" % m for m in range(self.lacp)])] if tier > 0 else []
+        if tier > 0:  # the uplink sees the parent, as on the real switches
+            lldp["et-0/0/0"] = self.ip(tier - 1, pair // self.fanout, side)
+        if tier < self.tiers - 1:
+            for k in range(self.fanout):
+                members = ["xe-0/0/%d" % (k * self.lacp + m) for m in range(self.lacp)]
+                aggregates.append((k + 1, members))
+                lldp[members[0]] = self.ip(tier + 1, pair * self.fanout + k, side)
+        for number, members in aggregates:
+            info = etree.SubElement(lacp, 'lacp-interface-information')
+            header = etree.SubElement(info, 'lag-lacp-header')
+            etree.SubElement(header, 'aggregate-name').text = "ae%d" % number
+            for member in members:
+                protocol = etree.SubElement(info, 'lag-lacp-protocol')
+                etree.SubElement(protocol, 'name').text = member
+        replies['lacp'] = etree.tostring(lacp)
+        replies['lldp'] = lldp
+        replies['interfaces'] = ["ae%d" % number for number, members in aggregates] + \
+            [member for number, members in aggregates for member in members]
+        if tier == self.tiers - 1:
+            replies['interfaces'] += ["ge-0/0/%d" % n for n in range(self.hosts)]
+
+        configuration = etree.fromstring("<configuration><interfaces>" + "".join(
+            "<interface><name>ge-0/0/%d</name><description>synthetic port %d</description></interface>" % (n, n)
+            for n in range(self.config)) + "</interfaces></configuration>")
+        iccp = etree.SubElement(etree.SubElement(configuration, 'protocols'), 'iccp')
+        peer = etree.SubElement(iccp, 'peer')
+        etree.SubElement(peer, 'name').text = "10.254.%d.%d" % (tier, pair)
+        backup = etree.SubElement(peer, 'backup-liveness-detection')
+        etree.SubElement(backup, 'backup-peer-ip').text = self.ip(tier, pair, 1 - side)
+        replies['config'] = etree.tostring(configuration)
+        return replies
+
+    def replies(self, ip):
+        '''
+        :param ip: management IP (string)
+        :return: dict with the generated tables (serialized) of the device, None if the IP isn't part of the fabric
+        '''
+        if ip not in self._replies:
+            if self._locations.get(ip) is None:
+                return None
+            self._replies[ip] = self._build(ip)
+        return self._replies[ip]
+
+
+def _physical_interface(name, elapsed=0.0):
+    from intCounters import COUNTER_SCHEMA
+    phy = etree.Element('physical-interface')
+    etree.SubElement(phy, 'name').text = name
+    seed = sum(name.encode())
+    growth = elapsed * (seed % 4 + 1) if seed % 3 == 0 else 0.0  # errors/s of the first counter of each section
+    for n, (header, tag, fields) in enumerate(COUNTER_SCHEMA):
+        section = etree.SubElement(phy, tag)
+        if tag == 'queue-counters':
+            for forwarding_class in ('best-effort', 'expedited-forwarding', 'assured-forwarding', 'network-control'):
+                queue = etree.SubElement(section, 'queue')
+                etree.SubElement(queue, 'forwarding-class-name').text = forwarding_class
+                etree.SubElement(queue, 'queue-counters-total-drop-packets').text = str(seed % 7)
+        for m, (field, leaf, label, kinds) in enumerate(fields):
+            etree.SubElement(section, leaf).text = str((seed * (n + 1) + m) % 5 + (int(growth) if m == 0 else 0))
+    return phy
+
+
+class SyntheticDevice(ReplayDevice):
+    '''
+    Device of a SyntheticFabric, it supports the same filters of Junos (ARP hostname, MAC address, config filter_xml,
+    list of interface names)
+    '''
+
+    def __init__(self, ip, fabric, latency=0.0, connect_latency=0.0):
+        ReplayDevice.__init__(self, ip, None, latency, connect_latency)
+        self.fabric = fabric
+
+    def open(self, **kwargs):
+        replies = self.fabric.replies(self.ip)
+        if replies is None:
+            from jnpr.junos.exception import ConnectError
+            raise ConnectError(self, self.ip + " isn't part of the synthetic fabric")
+        time.sleep(self.connect_latency)
+        self.facts = {'hostname': replies['hostname']}
+        self.connected = True
+        return self
+
+    def reply(self, name, kwargs):
+        time.sleep(self.latency)
+        replies = self.fabric.replies(self.ip)  # the tables are kept serialized, every reply is parsed again
+        if name == 'get_arp_table_information':
+            if 'hostname' in kwargs:  # the device filters, only the entry of the target travels
+                mac = replies['arp_entries'].get(kwargs['hostname'])
+                entry = _ARP_ENTRY % (mac, kwargs['hostname']) if mac is not None else ""
+                return etree.fromstring("<arp-table-information>" + entry + "</arp-table-information>")
+            return etree.fromstring(replies['arp'])
+        if name == 'get_ethernet_switching_table_information':
+            if 'address' in kwargs:
+                logical = replies['mac_entries'].get(kwargs['address'])
+                entry = _MAC_ENTRY % (kwargs['address'], logical) if logical is not None else ""
+                return etree.fromstring("<l2ng-l2ng-mac-table><l2ng-mac-entry-db>" + entry +
+                                        "</l2ng-mac-entry-db></l2ng-l2ng-mac-table>")
+            return etree.fromstring(replies['mac'])
+        if name == 'get_config':
+            reply = etree.fromstring(replies['config'])
+            if kwargs.get('filter_xml') is not None:
+                for child in list(reply):
+                    if child.tag != 'protocols':
+                        reply.remove(child)
+            return reply
+        if name == 'get_lacp_interface_information':
+            return etree.fromstring(replies['lacp'])
+        if name == 'get_lldp_neighbors_information':
+            reply = etree.Element('lldp-neighbors-information')
+            for interface in replies['lldp']:
+                neighbor = etree.SubElement(reply, 'lldp-neighbor-information')
+                etree.SubElement(neighbor, 'lldp-local-port-id').text = interface
+            return reply
+        if name == 'get_lldp_interface_neighbors':
+            reply = etree.Element('lldp-neighbors-information')
+            child = replies['lldp'].get(kwargs.get('interface_device'))
+            if child is not None:
+                neighbor = etree.SubElement(reply, 'lldp-neighbor-information')
+                etree.SubElement(neighbor, 'lldp-remote-management-address').text = child
+            return reply
+        if name == 'get_interface_information':
+            names = kwargs.get('interface_name')
+            if names is None:  # every interface of the device
+                names = replies['interfaces']
+            names = list(names) if isinstance(names, (list, tuple)) else [names]
+            reply = etree.Element('interface-information')
+            for interface in names:
+                reply.append(_physical_interface(interface, time.monotonic() - self.fabric.start))
+            return reply
+        from jnpr.junos.exception import RpcError
+        raise RpcError(cmd=name)
+
+    def rpc_stream(self, name, **kwargs):
+        '''
+        :return: the reply of the rpc as a binary file object, the full ARP/MAC tables are served without a parse
+        '''
+        table = {'get_arp_table_information': 'arp', 'get_ethernet_switching_table_information': 'mac'}.get(name)
+        if table is None or 'hostname' in kwargs or 'address' in kwargs:
+            return io.BytesIO(etree.tostring(self.reply(name, kwargs)))
+        time.sleep(self.latency)
+        return io.BytesIO(self.fabric.replies(self.ip)[table])
+
+
+class SyntheticBackend:
+    '''
+    Devices of a SyntheticFabric
+    '''
+    needs_credentials = False
+    streams = True
+
+    def __init__(self, fabric, latency=0.0, connect_latency=0.0):
+        self.fabric = fabric
+        self.latency = latency
+        self.connect_latency = connect_latency
+
+    def device(self, ip, user, password):
+        return SyntheticDevice(ip, self.fabric, self.latency, self.connect_latency)
+
+
+def make_backend(replay=None, synthetic=None, record=None, latency=0.0, connect_latency=0.0):
+    '''
+    :param replay: directory (string) of the replies saved by RecordBackend, None to not replay
+    :param synthetic: spec (string) of a SyntheticFabric, e.g. "tiers=3,fanout=2", None to not generate a fabric
+    :param record: directory (string) where the replies are saved, None to not record
+    :param latency: with replay/synthetic, seconds of every RPC
+    :param connect_latency: with replay/synthetic, seconds of every connection
+    :return: backend object, JunosBackend if neither replay nor synthetic is given
+    '''
+    if replay is not None:
+        backend = ReplayBackend(replay, latency, connect_latency)
+    elif synthetic is not None:
+        backend = SyntheticBackend(SyntheticFabric.from_spec(synthetic), latency, connect_latency)
+    else:
+        backend = JunosBackend()
+    if record is not None:
+        backend = RecordBackend(record, backend)
+    return backend
@@ -0,0 +1,135 @@
+'''
+Fabric-wide sweep of the interface errors, without a target (--sweep).
+
+Starting from the core, every switch is reached through the ICCP peers and the LLDP neighbors (the adjacency function
+is given by the caller, so the topology cache is used when enabled). A bounded pool of threads connects to the switches
+and pulls the extensive counters of all their interfaces with one RPC each; the replies are handed, serialized, to a
+pool of processes that parses them and scores every interface, so the walk of big replies doesn't hold the GIL of the
+collectors. The result is the list of the interfaces with the most errors of the fabric.
+'''
+
+import heapq
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from lxml import etree
+from intCounters import FIELDS, parse_intInfo
+from counterSampler import LABELS
+from rpcSnapshot import get_snapshot
+
+DEFAULT_WORKERS = 16
+# counters summed in the score of an interface, the FEC ones are rates and aren't comparable with the others
+SCORE_FIELDS = tuple(n for n, field in enumerate(FIELDS) if not field.startswith('fec_'))
+
+
+def score_interfaces(ip, reply):
+    '''
+    :param ip: management IP (string) of the device
+    :param reply: serialized (bytes) reply of get_interface_information extensive
+    :return: tuple (ip, list of tuples (score, interface, list of (value, label) of the 3 highest counters)) of the
+             interfaces with at least one error; runs in a worker process
+    '''
+    scored = []
+    for name, counters in parse_intInfo(etree.fromstring(reply)).items():
+        values = counters.values
+        errors = [(values[n], LABELS[n]) for n in SCORE_FIELDS if isinstance(values[n], int) and values[n] > 0]
+        if len(errors) > 0:
+            errors.sort(reverse=True)
+            scored.append((sum(value for value, label in errors), name, errors[:3]))
+    return ip, scored
+
+
+def collect_device(ip, acquire, release, neighbors):
+    '''
+    :param ip: management IP (string) of the device
+    :param acquire: function mgmt IP -> opened device, None if it wasn't possible to connect
+    :param release: function device -> None
+    :param neighbors: function (device, ip) -> list of mgmt IPs of the adjacent devices
+    :return: tuple (ip, hostname, adjacent IPs, serialized counters reply, error): hostname is None if it wasn't
+             possible to connect, error is the text of the exception that stopped the collection (else None)
+    '''
+    device = acquire(ip)
+    if device is None:
+        return ip, None, [], None, "connection failed"
+    try:
+        hostname = device.facts['hostname']
+        adjacent = neighbors(device, ip)
+        reply = get_snapshot(device).rpc('get_interface_information', extensive=True)
+        return ip, hostname, adjacent, etree.tostring(reply), None
+    except Exception as exception:  # a switch that fails doesn't stop the sweep
+        return ip, None, [], None, str(exception) or type(exception).__name__
+    finally:
+        release(device)
+
+
+class SweepResult:
+    '''
+    Devices reached by the sweep and scored interfaces
+    '''
+
+    def __init__(self):
+        self.hostnames = {}  # mgmt IP -> hostname of the devices swept
+        self.failed = {}  # mgmt IP -> reason of the devices that couldn't be swept
+        self.interfaces = []  # tuples (score, mgmt IP, interface, highest counters)
+
+    def ranked(self, limit):
+        '''
+        :param limit: number of interfaces
+        :return: the limit interfaces with the highest score, worst first
+        '''
+        return heapq.nlargest(limit, self.interfaces, key=lambda i: (i[0], i[1], i[2]))
+
+    def render(self, limit):
+        '''
+        :param limit: number of interfaces in the ranking
+        :return: text (string) of the ranking followed by the devices that couldn't be swept
+        '''
+        lines = ["Sweep: " + str(len(self.hostnames)) + " devices, " + str(len(self.interfaces)) +
+                 " interfaces with errors, " + str(len(self.failed)) + " devices not swept", ""]
+        for rank, (score, ip, name, errors) in enumerate(self.ranked(limit), 1):
+            lines.append("%4d. %12d  %s(%s) %s" % (rank, score, self.hostnames[ip], ip, name))
+            lines.append("\t" + ", ".join(label + ": " + str(value) for value, label in errors))
+        for ip in sorted(self.failed):
+            lines.append("Not swept " + ip + ": " + self.failed[ip])
+        return "\n".join(lines) + "\n"
+
+
+def sweep_fabric(core, acquire, release, neighbors, workers=DEFAULT_WORKERS, processes=None):
+    '''
+    :param core: management IP (string) where the walk starts
+    :param acquire: same as collect_device
+    :param release: same as collect_device
+    :param neighbors: same as collect_device
+    :param workers: number of devices collected at the same time
+    :param processes: number of parsing processes, None for the number of CPUs
+    :return: SweepResult object
+    '''
+    # multiprocessing is imported only by a sweep, a trace doesn't pay for it
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    result = SweepResult()
+    visited = {core}
+    parsing = []
+    # the parsing processes are started without forking this process, whose session and collector threads would be
+    # copied in an unsafe state: forkserver where available, else spawn
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count() or 1, mp_context=context) as parsers:
+        with ThreadPoolExecutor(max_workers=workers) as collectors:
+            running = {collectors.submit(collect_device, core, acquire, release, neighbors)}
+            while len(running) > 0:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ip, hostname, adjacent, reply, error = future.result()
+                    if error is not None:
+                        result.failed[ip] = error
+                        continue
+                    result.hostnames[ip] = hostname
+                    parsing.append(parsers.submit(score_interfaces, ip, reply))
+                    for neighbor in adjacent:  # the walk goes on as soon as a device is done
+                        if neighbor is not None and neighbor not in visited:
+                            visited.add(neighbor)
+                            running.add(collectors.submit(collect_device, neighbor, acquire, release, neighbors))
+            for future in parsing:
+                ip, scored = future.result()
+                result.interfaces.extend((score, ip, name, errors) for score, name, errors in scored)
+    return result
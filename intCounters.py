@@ -0,0 +1,219 @@
+'''
+Collection, parsing and rendering of the interface counters (get_interface_information extensive).
+
+An aggregate and all its LACP members are asked to the device with a single RPC, the reply is split once per
+physical-interface and kept in the device snapshot, so save_intErrors doesn't need a round trip per interface.
+
+The counters are described by COUNTER_SCHEMA: every physical-interface subtree is walked once and its leaves are
+stored in an InterfaceCounters record, render_intCounters turns the record into the text layout of the report.
+'''
+
+from rpcSnapshot import get_snapshot, is_rpc_error
+
+AGGREGATE = 'ae'
+PHYSICAL = 'phy'
+BOTH = (AGGREGATE, PHYSICAL)
+
+# sections of the report in the order they are written: (header, parent tag, counters)
+# each counter is (field name, leaf tag, label in the report, kinds of interface where it's reported)
+COUNTER_SCHEMA = (
+    ("Input error list:", 'input-error-list', (
+        ('input_errors', 'input-errors', 'input-errors', BOTH),
+        ('input_drops', 'input-drops', 'input-drops', BOTH),
+        ('framing_errors', 'framing-errors', 'framing-errors', BOTH),
+        ('input_runts', 'input-runts', 'input runts', BOTH),
+        ('input_giants', 'input-giants', 'input-giants', (AGGREGATE,)),
+        ('input_discards', 'input-discards', 'input-discards', BOTH),
+        ('input_l3_incompletes', 'input-l3-incompletes', 'input-l3-incompletes', (PHYSICAL,)),
+        ('input_l2_channel_errors', 'input-l2-channel-errors', 'input-l2-channel-errors', (PHYSICAL,)),
+        ('input_l2_mismatch_timeouts', 'input-l2-mismatch-timeouts', 'input-l2-mismatch-timeouts', (PHYSICAL,)),
+        ('input_fifo_errors', 'input-fifo-errors', 'input-fifo-errors', (PHYSICAL,)),
+        ('input_resource_errors', 'input-resource-errors', 'input-resource-errors', BOTH),
+    )),
+    ("Output error list:", 'output-error-list', (
+        ('carrier_transitions', 'carrier-transitions', 'carrier-transitions', BOTH),
+        ('output_errors', 'output-errors', 'output-errors', BOTH),
+        ('output_collisions', 'output-collisions', 'output-collisions', (PHYSICAL,)),
+        ('output_drops', 'output-drops', 'output-drops', BOTH),
+        ('aged_packets', 'aged-packets', 'aged-packets', (PHYSICAL,)),
+        ('mtu_errors', 'mtu-errors', 'mtu-errors', BOTH),
+        ('hs_link_crc_errors', 'hs-link-crc-errors', 'hs-link-crc-errors', (PHYSICAL,)),
+        ('output_fifo_errors', 'output-fifo-errors', 'output-fifo-errors', (PHYSICAL,)),
+        ('output_resource_errors', 'output-resource-errors', 'output-resource-errors', BOTH),
+    )),
+    ("Queue counters errors:", 'queue-counters', ()),  # one line per queue, see InterfaceCounters.queues
+    ("ethernet-pcs-statistics:", 'ethernet-pcs-statistics', (
+        ('bit_error_seconds', 'bit-error-seconds', 'bit-error-seconds', (PHYSICAL,)),
+        ('errored_blocks_seconds', 'errored-blocks-seconds', 'errored-blocks-seconds', (PHYSICAL,)),
+    )),
+    ("ethernet-fec-statistics:", 'ethernet-fec-statistics', (
+        ('fec_ccw_error_rate', 'fec_ccw_error_rate', 'fec_ccw_error_rate', (PHYSICAL,)),
+        ('fec_nccw_error_rate', 'fec_nccw_error_rate', 'fec_nccw_error_rate', (PHYSICAL,)),
+    )),
+    ("ethernet-mac-statistics:", 'ethernet-mac-statistics', (
+        ('mac_input_crc_errors', 'input-crc-errors', 'input-crc-errors', (PHYSICAL,)),
+        ('mac_output_crc_errors', 'output-crc-errors', 'output-crc-errors', (PHYSICAL,)),
+        ('mac_input_fifo_errors', 'input-fifo-errors', 'input-fifo-errors', (PHYSICAL,)),
+        ('mac_output_fifo_errors', 'output-fifo-errors', 'output-fifo-errors', (PHYSICAL,)),
+    )),
+)
+
+FIELDS = tuple(c[0] for section in COUNTER_SCHEMA for c in section[2])  # field name of every slot of the record
+FIELD_INDEX = {field: n for n, field in enumerate(FIELDS)}
+# (parent tag, leaf tag) -> slot of the record, used by the parser to place a leaf with a single dict lookup
+_LEAF_INDEX = {(section[1], c[1]): FIELD_INDEX[c[0]] for section in COUNTER_SCHEMA for c in section[2]}
+_SECTION_TAGS = frozenset(section[1] for section in COUNTER_SCHEMA)
+
+
+class InterfaceCounters:
+    '''
+    Counters of one interface, values[n] is the counter FIELDS[n] (None if the device didn't return it)
+    '''
+    __slots__ = ('name', 'kind', 'values', 'queues')
+
+    def __init__(self, name):
+        '''
+        :param name: interface name (string)
+        '''
+        self.name = name
+        self.kind = AGGREGATE if name.startswith("ae") else PHYSICAL
+        self.values = [None] * len(FIELDS)
+        self.queues = []  # list of tuples (forwarding class name, total drop packets)
+
+    def __getattr__(self, field):
+        # only called for names that aren't slots, e.g. counters.input_errors
+        try:
+            return self.values[FIELD_INDEX[field]]
+        except KeyError:
+            raise AttributeError(field) from None
+
+    def as_dict(self):
+        '''
+        :return: dict field name -> value, with the queue drops under 'queues'
+        '''
+        result = dict(zip(FIELDS, self.values))
+        result['queues'] = dict(self.queues)
+        return result
+
+
+def to_number(text):
+    '''
+    :param text: text (string) of a counter leaf
+    :return: the counter as integer, the string itself if it isn't a number
+    '''
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return text
+
+
+def parse_intCounters(phy, name=None):
+    '''
+    :param phy: physical-interface element
+    :param name: interface name (string), read from the element if None
+    :return: InterfaceCounters record filled walking the subtree once
+    '''
+    if name is None:
+        name = (phy.findtext('name') or '').strip()
+    counters = InterfaceCounters(name)
+    values = counters.values
+    for section in phy:
+        tag = section.tag
+        if tag not in _SECTION_TAGS:
+            continue
+        if tag == 'queue-counters':
+            for queue in section:
+                if queue.tag == 'queue':
+                    counters.queues.append((queue.findtext('forwarding-class-name'),
+                                            to_number(queue.findtext('queue-counters-total-drop-packets'))))
+            continue
+        for leaf in section:
+            slot = _LEAF_INDEX.get((tag, leaf.tag))
+            if slot is not None:
+                values[slot] = to_number(leaf.text)
+    return counters
+
+
+def render_intCounters(counters):
+    '''
+    :param counters: InterfaceCounters record
+    :return: string with the counters in the layout of the report, missing counters are written as N/A
+    '''
+    kind = counters.kind
+    values = counters.values
+    lines = ["", counters.name]
+    for header, tag, fields in COUNTER_SCHEMA:
+        if tag == 'queue-counters':
+            lines.append(header)
+            for forwarding_class, drops in counters.queues:
+                lines.append("\t" + str(forwarding_class) + " drops: " + str(drops))
+            continue
+        shown = [c for c in fields if kind in c[3]]
+        if len(shown) == 0:
+            continue
+        lines.append(header)
+        for field, leaf, label, kinds in shown:
+            value = values[FIELD_INDEX[field]]
+            lines.append("\t" + label + ": " + ("N/A" if value is None else str(value)))
+    return "\n".join(lines) + "\n"
+
+
+def split_intInfo(intInfo):
+    '''
+    :param intInfo: reply of get_interface_information, with one or more physical-interface
+    :return: dict interface name (string) -> physical-interface element
+    '''
+    interfaces = {}
+    for i in intInfo.iter('physical-interface'):
+        name = i.findtext('name')
+        if name is not None:
+            interfaces[name.strip()] = i
+    return interfaces
+
+
+def parse_intInfo(intInfo):
+    '''
+    :param intInfo: reply of get_interface_information, with one or more physical-interface
+    :return: dict interface name (string) -> InterfaceCounters
+    '''
+    return {name: parse_intCounters(phy, name) for name, phy in split_intInfo(intInfo).items()}
+
+
+def collect_intInfo(device, interfaces):
+    '''
+    :param device: jnpr.junos Device object
+    :param interfaces: list of interface names (string), e.g. an aggregate and its LACP members
+    :return: None, the counters of all the interfaces are fetched with one RPC and kept in the snapshot; the ones
+             missing from the reply (or all of them, if the device rejects the list) are fetched one by one later
+    '''
+    snapshot = get_snapshot(device)
+    collected = snapshot.index('intf', dict)
+    missing = [i for i in interfaces if i not in collected]
+    if len(missing) < 2 or 'get_interface_information' in snapshot.rejected:
+        return
+    try:
+        intInfo = snapshot.rpc('get_interface_information', interface_name=tuple(missing), extensive=True)
+    except Exception as exception:
+        if is_rpc_error(exception) is False:
+            raise
+        snapshot.rejected.add('get_interface_information')  # this platform wants one interface-name per RPC
+        return
+    collected.update(snapshot.parse('intf', parse_intInfo, intInfo))
+
+
+def get_intCounters(device, interface):
+    '''
+    :param device: jnpr.junos Device object
+    :param interface: interface name (string)
+    :return: InterfaceCounters of the interface, with every counter None if the device doesn't return it
+    '''
+    snapshot = get_snapshot(device)
+    collected = snapshot.index('intf', dict)
+    if interface not in collected:
+        intInfo = snapshot.rpc('get_interface_information', interface_name=interface, extensive=True)
+        collected.update(snapshot.parse('intf', parse_intInfo, intInfo))
+    counters = collected.get(interface)
+    if counters is None:
+        counters = InterfaceCounters(interface)
+        collected[interface] = counters
+    return counters
@@ -0,0 +1,164 @@
+'''
+Report sinks: where the results of a run are written (--format).
+
+A sink receives the text of the report, the traced targets and the result of a sweep, and writes what its format
+needs: TextSink the text layout of the .txt report, JsonLinesSink and CsvSink one row per interface on the path of
+every target (and per ranked interface of a sweep), with the counters of intCounters.FIELDS as columns. The rows are
+written through a buffered file, flushed only when the sink is closed.
+'''
+
+import bisect
+import csv
+import json
+from intCounters import FIELDS
+
+DEFAULT_BUFFER = 1 << 20  # bytes kept in memory before a write to disk
+
+# columns of the rows of a trace: one row per interface on the path of a target (or of one of its branches)
+TRACE_COLUMNS = ('target', 'mac', 'branch', 'tier', 'device', 'hostname', 'interface') + FIELDS + ('queue_drops',)
+# columns of the rows of a sweep: one row per ranked interface
+SWEEP_COLUMNS = ('rank', 'score', 'device', 'hostname', 'interface', 'errors')
+
+
+def trace_rows(trace):
+    '''
+    :param trace: showCountersCascade.Trace object already traced
+    :return: generator of dicts with the TRACE_COLUMNS of every interface on the path of the trace and of its branches
+             (branch 0 is the main path, the forks follow in report order and repeat the hops they share)
+    '''
+    branches = [trace]
+    for branch, current in enumerate(branches):
+        branches.extend(current.forks)
+        for n, (ip, hostname, names) in enumerate(current.path):
+            tier = bisect.bisect_right(current.tiers, n) - 1
+            for name in names:
+                row = {'target': current.ip, 'mac': current.mac, 'branch': branch, 'tier': tier, 'device': ip,
+                       'hostname': hostname, 'interface': name}
+                record = current.counters.get((ip, name))
+                values = record.values if record is not None else [None] * len(FIELDS)
+                row.update(zip(FIELDS, values))
+                drops = [d for c, d in record.queues if isinstance(d, int)] if record is not None else []
+                row['queue_drops'] = sum(drops) if len(drops) > 0 else None
+                yield row
+
+
+def sweep_rows(result, limit):
+    '''
+    :param result: fabricSweep.SweepResult object
+    :param limit: number of interfaces in the ranking
+    :return: generator of dicts with the SWEEP_COLUMNS of the ranked interfaces, worst first
+    '''
+    for rank, (score, ip, name, errors) in enumerate(result.ranked(limit), 1):
+        yield {'rank': rank, 'score': score, 'device': ip, 'hostname': result.hostnames[ip], 'interface': name,
+               'errors': ", ".join(label + ": " + str(value) for value, label in errors)}
+
+
+class ReportSink:
+    '''
+    Base class of the sinks, every method does nothing unless the format needs it
+    '''
+    extension = None
+    newline = ''  # the rows are written as they are, the csv module ends its lines by itself
+
+    def __init__(self, name, buffering=DEFAULT_BUFFER):
+        '''
+        :param name: path (string) of the report without the extension, the one of the format is added
+        :param buffering: size (bytes) of the write buffer
+        '''
+        self.path = name + self.extension
+        self.file = open(self.path, 'w', buffering=buffering, newline=self.newline)
+
+    def text(self, text):
+        '''
+        :param text: text (string) of the report: title, devices crossed, summary
+        '''
+
+    def trace(self, trace):
+        '''
+        :param trace: Trace object whose path is written
+        '''
+
+    def sweep(self, result, limit):
+        '''
+        :param result: fabricSweep.SweepResult object
+        :param limit: number of interfaces in the ranking
+        '''
+
+    def close(self):
+        '''
+        :return: None, the buffer is written and the file closed
+        '''
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TextSink(ReportSink):
+    '''
+    Text layout of the report, the same written before the sinks existed
+    '''
+    extension = ".txt"
+    newline = None  # newlines translated to the ones of the platform, as in the original report
+
+    def text(self, text):
+        self.file.write(text)
+
+    def sweep(self, result, limit):
+        self.file.write(result.render(limit))
+
+
+class JsonLinesSink(ReportSink):
+    '''
+    One JSON object per row, the counters missing on the device are null
+    '''
+    extension = ".jsonl"
+
+    def _write(self, rows):
+        write = self.file.write
+        for row in rows:
+            write(json.dumps(row, separators=(',', ':')) + "\n")
+
+    def trace(self, trace):
+        self._write(trace_rows(trace))
+
+    def sweep(self, result, limit):
+        self._write(sweep_rows(result, limit))
+
+
+class CsvSink(ReportSink):
+    '''
+    One CSV line per row, with a header line; a report has either trace rows or sweep rows
+    '''
+    extension = ".csv"
+
+    def __init__(self, name, buffering=DEFAULT_BUFFER):
+        super().__init__(name, buffering)
+        self.writer = None
+
+    def _write(self, columns, rows):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, columns)
+            self.writer.writeheader()
+        self.writer.writerows(rows)
+
+    def trace(self, trace):
+        self._write(TRACE_COLUMNS, trace_rows(trace))
+
+    def sweep(self, result, limit):
+        self._write(SWEEP_COLUMNS, sweep_rows(result, limit))
+
+
+SINKS = {'text': TextSink, 'jsonl': JsonLinesSink, 'csv': CsvSink}
+
+
+def open_sinks(formats, name):
+    '''
+    :param formats: list of format names (keys of SINKS)
+    :param name: path (string) of the report without the extension
+    :return: list of the opened sinks, one per format
+    '''
+    return [SINKS[report_format](name) for report_format in formats]
@@ -0,0 +1,156 @@
+'''
+Instrumentation of the connections and of the RPCs of a run (--profile).
+
+Every connection (device.open plus the first facts['hostname'], which is when PyEZ gathers the facts), every RPC sent
+to a device and every parse of a reply done by the script is recorded with its wall time; the RPCs also with the size
+of the reply serialized again (not the bytes on the wire) and the number of XML elements received. At the end of the
+run the events are written as JSON lines, one object per event with the hop (depth of the device in the cascade) it
+belongs to, and summarized in a table per RPC, per hop and per device.
+
+The profile is disabled by default: profiler is None and the hooks cost a single check of the module variable.
+'''
+
+import json
+import threading
+import time
+
+profiler = None  # RpcProfiler of the run, None when the profile is disabled
+
+CONNECT = 'connect'
+FACTS = 'facts'
+RPC = 'rpc'
+PARSE = 'parse'
+
+
+class RpcProfiler:
+    '''
+    Events of the run, each one is a dict with event, device, name, start and wall (seconds) and, for the RPCs, bytes
+    and elements
+    '''
+
+    def __init__(self, path):
+        '''
+        :param path: path (string) of the JSON lines file, written by close()
+        '''
+        self.path = path
+        self.events = []
+        self.devices = {}  # id(device) -> management IP, filled on connection
+        self.hops = {}  # management IP -> depth of the device in the cascade (0 is the core)
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()  # the peers of a tier and the connections opened in advance run in threads
+
+    def _record(self, event, device_ip, name, start, wall, **extra):
+        entry = {'event': event, 'device': device_ip, 'name': name, 'start': round(start - self.start, 6),
+                 'wall': round(wall, 6)}
+        entry.update(extra)
+        with self._lock:
+            self.events.append(entry)
+
+    def connect(self, device, ip):
+        '''
+        :param device: jnpr.junos Device object not opened yet
+        :param ip: management IP (string) of the device
+        :return: None, the device is opened and its facts gathered, the time of both is recorded; the exception of
+                 a failed open() is recorded and raised again
+        '''
+        self.devices[id(device)] = ip
+        start = time.perf_counter()
+        try:
+            device.open(normalize=True)
+        except Exception as exception:
+            self._record(CONNECT, ip, 'open', start, time.perf_counter() - start, error=type(exception).__name__)
+            raise
+        middle = time.perf_counter()
+        self._record(CONNECT, ip, 'open', start, middle - start)
+        device.facts['hostname']  # facts are gathered on first access, later accesses are served from memory
+        self._record(FACTS, ip, 'hostname', middle, time.perf_counter() - middle)
+
+    def rpc(self, device, label, start, wall, size, reply):
+        '''
+        :param device: jnpr.junos Device object
+        :param label: name (string) of the rpc in the profile, e.g. 'get_arp_table_information (filtered)'
+        :param start: time.perf_counter() when the rpc was sent
+        :param wall: seconds until the reply was received
+        :param size: bytes (integer) of the reply serialized again
+        :param reply: rpc reply (lxml Element), its elements are counted
+        '''
+        try:
+            elements = sum(1 for _ in reply.iter())
+        except AttributeError:  # some rpc return a bool instead of an xml
+            elements = 0
+        self._record(RPC, self.devices.get(id(device)), label, start, wall, bytes=size, elements=elements)
+
+    def parse(self, device, name, parser, *arguments):
+        '''
+        :param device: jnpr.junos Device object whose reply is parsed
+        :param name: name (string) of the parse, e.g. 'arp' for the ARP index
+        :param parser: function to time
+        :param arguments: arguments of the function
+        :return: the result of parser(*arguments)
+        '''
+        start = time.perf_counter()
+        result = parser(*arguments)
+        self._record(PARSE, self.devices.get(id(device)), name, start, time.perf_counter() - start)
+        return result
+
+    def set_hop(self, ip, hop):
+        '''
+        :param ip: management IP (string) of a device that has been dug
+        :param hop: depth (integer) of the device in the cascade
+        '''
+        self.hops.setdefault(ip, hop)
+
+    def close(self):
+        '''
+        :return: None, the events are written as JSON lines in order of start
+        '''
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e['start'])
+        with open(self.path, 'w') as file:
+            for entry in events:
+                entry = dict(entry, hop=self.hops.get(entry['device']))
+                file.write(json.dumps(entry, separators=(',', ':')) + "\n")
+
+    def summary(self):
+        '''
+        :return: string with the table of the events grouped per RPC, per hop and per device
+        '''
+        with self._lock:
+            events = list(self.events)
+        lines = ["Profile (" + str(len(events)) + " events, written in " + self.path + "):"]
+        lines.append("%-56s %6s %9s %9s %11s %10s" % ("per RPC", "calls", "wall [s]", "max [s]", "ser. bytes",
+                                                      "elements"))
+        rows = {}
+        for entry in events:
+            if entry['event'] in (RPC, PARSE):
+                name = entry['name'] if entry['event'] == RPC else "parse " + entry['name']
+                row = rows.setdefault(name, [0, 0.0, 0.0, 0, 0])
+                row[0] += 1
+                row[1] += entry['wall']
+                row[2] = max(row[2], entry['wall'])
+                row[3] += entry.get('bytes', 0)
+                row[4] += entry.get('elements', 0)
+        for name in sorted(rows, key=lambda n: (n.startswith("parse "), n)):
+            calls, wall, longest, size, elements = rows[name]
+            lines.append("%-56s %6d %9.3f %9.3f %11d %10d" % (name, calls, wall, longest, size, elements))
+        for title, key in (("per hop", lambda e: self.hops.get(e['device'])), ("per device", lambda e: e['device'])):
+            lines.append("%-56s %11s %9s %9s %9s" % (title, "connect [s]", "facts [s]", "rpc [s]", "parse [s]"))
+            totals = {}
+            for entry in events:
+                total = totals.setdefault(key(entry), {CONNECT: 0.0, FACTS: 0.0, RPC: 0.0, PARSE: 0.0})
+                total[entry['event']] += entry['wall']
+            for group in sorted(totals, key=lambda g: (g is None, str(g))):
+                total = totals[group]
+                lines.append("%-56s %11.3f %9.3f %9.3f %9.3f" % (str(group), total[CONNECT], total[FACTS], total[RPC],
+                                                                 total[PARSE]))
+        return "\n".join(lines)
+
+
+def start_profile(path):
+    '''
+    :param path: path (string) of the JSON lines file of the profile
+    :return: the RpcProfiler, from now on every connection, RPC and parse is recorded
+    '''
+    global profiler
+    profiler = RpcProfiler(path)
+    return profiler
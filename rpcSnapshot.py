@@ -0,0 +1,279 @@
+'''
+Per-device snapshot of Junos RPC replies.
+
+During a hop the same tables are needed by several functions (ARP table, ethernet-switching table, configuration),
+the snapshot fetches each of them from the device only once and serves the following calls from memory until the
+snapshot is invalidated (normally when the hop is over and the device is closed).
+
+In filtered mode the lookups ask the device only for the data they need (ARP entry of one IP, MAC table entry of one
+MAC, protocols/iccp configuration); if a platform rejects the filter the full table is pulled as before.
+
+In stream mode a single ARP/MAC lookup reads the raw reply incrementally, when the device can provide it (rpc_stream),
+instead of building the whole tree: see DeviceSnapshot.stream.
+
+The modes are chosen per snapshot by whoever opened the device (open_snapshot), settings holds the ones of the
+snapshots created without it.
+'''
+
+import threading
+import time
+from lxml import etree
+import rpcProfile
+
+settings = {'filtered': False, 'stream': False}  # default modes of the snapshots
+
+# counters shared by every snapshot, used to show how many round trips the cache has saved
+rpc_stats = {'issued': 0, 'saved': 0}
+# rpc name -> [replies, bytes], the size of the reply serialized again (not the bytes on the wire), counted only in
+# filtered mode or with the profile, where it's reported
+rpc_bytes = {}
+_stats_lock = threading.Lock()  # the peers of a tier can be handled by different threads
+
+_snapshots = {}  # id(device) -> DeviceSnapshot
+
+
+class DeviceSnapshot:
+    '''
+    Memoizes the RPC replies of one jnpr.junos Device object
+    '''
+
+    def __init__(self, device, filtered=None, streaming=None, rejected=None):
+        '''
+        :param device: jnpr.junos Device object
+        :param filtered: if True the lookups ask only the entries they need, None for settings['filtered']
+        :param streaming: if True a single lookup parses the raw reply, None for settings['stream']
+        :param rejected: set of the rpc names whose filter the device refused, shared with the caller to keep it after
+                         the hop (None for a set of this snapshot only)
+        '''
+        self.device = device
+        self.filtered = settings['filtered'] if filtered is None else filtered
+        self.streaming = settings['stream'] if streaming is None else streaming
+        self.replies = {}
+        self.indexes = {}  # structures parsed from the replies, they live as long as the replies
+        self.rejected = rejected if rejected is not None else set()
+        self.issued = 0
+        self.saved = 0
+
+    def rpc(self, name, **kwargs):
+        '''
+        :param name: name (string) of the PyEZ rpc method, e.g. 'get_arp_table_information'
+        :param kwargs: arguments of the rpc
+        :return: the rpc reply (lxml Element), fetched from the device only the first time it's requested
+        '''
+        return self._fetch(name, name, kwargs)
+
+    def filtered_rpc(self, name, filters, **kwargs):
+        '''
+        :param name: name (string) of the PyEZ rpc method
+        :param filters: dict with the arguments that make the device filter the reply, e.g. {'hostname': ip}
+        :param kwargs: arguments of the rpc that are always sent
+        :return: the filtered reply, or the full one if not in filtered mode, if the full reply is already in the
+                 snapshot or if the device rejected the filter
+        '''
+        full_key = rpc_key(name, kwargs)
+        if self.filtered is False or name in self.rejected or full_key in self.replies:
+            return self.rpc(name, **kwargs)
+        arguments = dict(kwargs)
+        arguments.update(filters)
+        try:
+            return self._fetch(name, name + " (filtered)", arguments)
+        except Exception as exception:
+            if is_rpc_error(exception) is False:
+                raise
+            self.rejected.add(name)  # the platform doesn't support the filter, don't try it again on this device
+            return self.rpc(name, **kwargs)
+
+    def _fetch(self, name, label, kwargs):
+        '''
+        :param name: name (string) of the PyEZ rpc method
+        :param label: name (string) used to account the size of the reply
+        :param kwargs: dict with the arguments of the rpc
+        :return: the rpc reply, from the snapshot if already fetched
+        '''
+        key = rpc_key(name, kwargs)
+        if key in self.replies:
+            self.saved += 1
+            with _stats_lock:
+                rpc_stats['saved'] += 1
+            return self.replies[key]
+        call = getattr(self.device.rpc, name)
+        if rpcProfile.profiler is None:
+            reply = call(**kwargs)
+            if self.filtered is True:  # the serialization costs as much as a parse of the reply
+                count_bytes(label, reply)
+        else:
+            start = time.perf_counter()
+            reply = call(**kwargs)
+            wall = time.perf_counter() - start
+            rpcProfile.profiler.rpc(self.device, label, start, wall, count_bytes(label, reply), reply)
+        self.issued += 1
+        with _stats_lock:
+            rpc_stats['issued'] += 1
+        self.replies[key] = reply
+        return reply
+
+    def stream(self, name, parser, **kwargs):
+        '''
+        :param name: name (string) of the PyEZ rpc method
+        :param parser: function file object -> result, reads the raw reply (and can stop before its end)
+        :param kwargs: arguments of the rpc
+        :return: the result of the parser, None if the device can't stream its replies or answered with an error (use
+                 rpc); the reply isn't kept, the caller keeps the result in an index
+        '''
+        source = getattr(self.device, 'rpc_stream', None)
+        if source is None:
+            return None
+        start = time.perf_counter()
+        raw = source(name, **kwargs)
+        self.issued += 1
+        with _stats_lock:
+            rpc_stats['issued'] += 1
+        if raw is None:
+            return None
+        try:
+            result = parser(raw)
+            size = raw.tell()  # bytes read until the parser stopped
+        finally:
+            raw.close()
+        label = name + " (stream, bytes parsed)"  # the rest of the reply is dropped unread, its size isn't known
+        add_bytes(label, size)
+        if rpcProfile.profiler is not None:
+            rpcProfile.profiler.rpc(self.device, label, start, time.perf_counter() - start, size, None)
+        return result
+
+    def index(self, name, builder):
+        '''
+        :param name: name (string) of the index, e.g. 'arp'
+        :param builder: function without arguments that builds the index (normally from a reply of self.rpc)
+        :return: the index, built only the first time it's requested
+        '''
+        if name not in self.indexes:
+            self.indexes[name] = builder()
+        return self.indexes[name]
+
+    def parse(self, name, parser, *arguments):
+        '''
+        :param name: name (string) of the parse, used by the profile
+        :param parser: function that parses a reply of the device
+        :param arguments: arguments of the function
+        :return: the result of parser(*arguments), timed if the profile is enabled
+        '''
+        if rpcProfile.profiler is None:
+            return parser(*arguments)
+        return rpcProfile.profiler.parse(self.device, name, parser, *arguments)
+
+    def invalidate(self, name=None):
+        '''
+        :param name: name (string) of the rpc to forget, if None every reply is forgotten
+        :return: None, the indexes are always dropped since they could be built from the forgotten replies
+        '''
+        self.indexes.clear()
+        if name is None:
+            self.replies.clear()
+        else:
+            for key in [k for k in self.replies if k[0] == name]:
+                del self.replies[key]
+
+
+def is_rpc_error(exception):
+    '''
+    :param exception: exception raised by an rpc
+    :return: True if it's a PyEZ RpcError (the device rejected the rpc); PyEZ is imported only when an rpc fails, so
+             the replayed and synthetic devices never load it
+    '''
+    from jnpr.junos.exception import RpcError
+    return isinstance(exception, RpcError)
+
+
+def rpc_key(name, kwargs):
+    '''
+    :param name: name (string) of the rpc
+    :param kwargs: dict with the arguments of the rpc
+    :return: hashable key of the rpc, list arguments (e.g. interface_name=[...]) are turned into tuples
+    '''
+    return name, tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in kwargs.items()))
+
+
+def get_snapshot(device):
+    '''
+    :param device: jnpr.junos Device object
+    :return: the DeviceSnapshot of the device, created the first time it's requested
+    '''
+    snapshot = _snapshots.get(id(device))
+    if snapshot is None or snapshot.device is not device:
+        snapshot = DeviceSnapshot(device)
+        _snapshots[id(device)] = snapshot
+    return snapshot
+
+
+def open_snapshot(device, filtered=None, streaming=None, rejected=None):
+    '''
+    :param device: jnpr.junos Device object, just taken for a hop
+    :param filtered: filtered mode of the hop, None for settings['filtered']
+    :param streaming: stream mode of the hop, None for settings['stream']
+    :param rejected: set of the rpc names whose filter the device refused (kept by the caller between the hops)
+    :return: the new DeviceSnapshot of the device, it replaces the previous one
+    '''
+    snapshot = DeviceSnapshot(device, filtered, streaming, rejected)
+    _snapshots[id(device)] = snapshot
+    return snapshot
+
+
+def invalidate_snapshot(device):
+    '''
+    :param device: jnpr.junos Device object
+    :return: None, the snapshot of the device is dropped (to be called when the hop is over)
+    '''
+    snapshot = _snapshots.pop(id(device), None)
+    if snapshot is not None:
+        snapshot.invalidate()
+
+
+def count_bytes(name, reply):
+    '''
+    :param name: name (string) of the rpc
+    :param reply: rpc reply (lxml Element)
+    :return: size (integer) of the reply serialized again, in bytes, also added to rpc_bytes
+    '''
+    try:
+        size = len(etree.tostring(reply))
+    except TypeError:  # some rpc return a bool instead of an xml
+        size = 0
+    return add_bytes(name, size)
+
+
+def add_bytes(name, size):
+    '''
+    :param name: name (string) of the rpc
+    :param size: bytes (integer) of the reply
+    :return: size, added to rpc_bytes
+    '''
+    with _stats_lock:
+        if name not in rpc_bytes:
+            rpc_bytes[name] = [0, 0]
+        rpc_bytes[name][0] += 1
+        rpc_bytes[name][1] += size
+    return size
+
+
+def bytes_summary():
+    '''
+    :return: string with replies and serialized size for each rpc name, empty if no size has been counted
+    '''
+    if len(rpc_bytes) == 0:
+        return ""
+    lines = ["Serialized size of the replies per RPC:"]
+    for name in sorted(rpc_bytes):
+        replies, size = rpc_bytes[name]
+        lines.append("\t" + name + ": " + str(replies) + " replies, " + str(size) + " bytes (" +
+                     str(size // replies) + " bytes/reply)")
+    return "\n".join(lines)
+
+
+def rpc_summary():
+    '''
+    :return: string with the number of rpc sent to the devices and the number of the ones served from the snapshot
+    '''
+    total = rpc_stats['issued'] + rpc_stats['saved']
+    return ("RPC snapshot: " + str(rpc_stats['issued']) + " RPC sent, " + str(rpc_stats['saved']) +
+            " served from cache (" + str(total) + " requested)")
@@ -0,0 +1,126 @@
+'''
+Pool of the device sessions, keyed by management IP.
+
+open_device/close_device take a session from the pool and give it back instead of connecting and disconnecting at
+every hop, so a device touched more than once (a cached adjacency revalidated on its parent, the same switch on the
+path of several traces of a long run) pays the SSH + NETCONF handshake only the first time. A session is closed once
+it has been idle for longer than idle_timeout, and checked before being handed out again: if its transport is down it
+is closed and a new session is opened.
+'''
+
+import threading
+import time
+
+DEFAULT_IDLE_TIMEOUT = 300  # seconds, Junos keeps an idle NETCONF session open much longer
+
+
+def is_alive(device):
+    '''
+    :param device: jnpr.junos Device object (or a device of another backend)
+    :return: True if the session is still up, according to the PyEZ flag and, for real devices, to the transport
+    '''
+    if getattr(device, 'connected', True) is False:
+        return False
+    connection = getattr(device, '_conn', None)  # ncclient Manager of a jnpr.junos Device
+    return connection is None or getattr(connection, 'connected', True) is True
+
+
+class SessionPool:
+    '''
+    Opened devices not in use, ready to be handed out again
+    '''
+
+    def __init__(self, connect, idle_timeout=DEFAULT_IDLE_TIMEOUT, check=is_alive):
+        '''
+        :param connect: function mgmt IP -> opened device, None if it wasn't possible to connect
+        :param idle_timeout: seconds after which an unused session is closed
+        :param check: function device -> True if the session can be used again (health check)
+        '''
+        self.connect = connect
+        self.idle_timeout = idle_timeout
+        self.check = check
+        self.idle = {}  # mgmt IP -> list of tuples (device, time.monotonic() when released)
+        self.owners = {}  # id(device) -> mgmt IP of the sessions handed out
+        self.opened = 0
+        self.reused = 0
+        self.dropped = 0
+        self._lock = threading.Lock()  # sessions are taken and given back by the peer threads and the preopen ones
+
+    def acquire(self, ip):
+        '''
+        :param ip: management IP (string) of the device
+        :return: opened device, an idle session of the IP if there's a healthy one, else a new one; None if it
+                 wasn't possible to connect
+        '''
+        self.expire()
+        while True:
+            with self._lock:
+                sessions = self.idle.get(ip)
+                device = sessions.pop()[0] if sessions else None
+            if device is None:
+                break
+            if self.check(device) is True:
+                with self._lock:
+                    self.reused += 1
+                    self.owners[id(device)] = ip
+                return device
+            with self._lock:
+                self.dropped += 1
+            _close(device)
+        device = self.connect(ip)
+        if device is not None:
+            with self._lock:
+                self.opened += 1
+                self.owners[id(device)] = ip
+        return device
+
+    def release(self, device):
+        '''
+        :param device: device returned by acquire
+        :return: None, the session is kept for the next acquire of the same IP (closed if it's down)
+        '''
+        with self._lock:
+            ip = self.owners.pop(id(device), None)
+        if ip is None or self.check(device) is False:
+            _close(device)
+            return
+        with self._lock:
+            self.idle.setdefault(ip, []).append((device, time.monotonic()))
+        self.expire()
+
+    def expire(self):
+        '''
+        :return: None, the sessions idle for longer than idle_timeout are closed
+        '''
+        limit = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for ip, sessions in self.idle.items():
+                expired.extend(device for device, released in sessions if released < limit)
+                sessions[:] = [s for s in sessions if s[1] >= limit]
+        for device in expired:
+            _close(device)
+
+    def close(self):
+        '''
+        :return: None, every idle session is closed (the ones handed out are closed when released)
+        '''
+        with self._lock:
+            sessions = [s[0] for entries in self.idle.values() for s in entries]
+            self.idle.clear()
+        for device in sessions:
+            _close(device)
+
+    def summary(self):
+        '''
+        :return: string with the sessions opened, reused and dropped by the health check
+        '''
+        return ("Session pool: " + str(self.opened) + " sessions opened, " + str(self.reused) + " reused, " +
+                str(self.dropped) + " dropped by the health check")
+
+
+def _close(device):
+    try:
+        device.close()
+    except Exception:  # the session may be already down, nothing else to do
+        pass
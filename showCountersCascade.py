@@ -1,10 +1,42 @@
+'''
+Report of the interface errors in the path Core>target IP, as a command line tool and as a library.
+
+The state of a run (device backend, credentials, session pool, topology cache, connections opened in advance, worker
+threads) is kept in a Cascade object, so the trace can be called from other code without prompts or report files:
+
+    with Cascade('10.0.0.1', 'user', password) as cascade:
+        traces = cascade.trace(['192.168.1.10'])
+
+main() is the command line: it reads the options, asks what is missing, runs the Cascade and writes the reports
+through the sinks of reportSinks (--format). PyEZ is imported only when the first device is contacted (JunosBackend),
+the modules needed only by some options (asyncio, the process pool of the sweep) when the option is used.
+'''
+
 from pprint import pprint
-from jnpr.junos import *
 from datetime import datetime
 from getpass import getpass
 import sys
+import argparse
+import io
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from rpcSnapshot import get_snapshot, open_snapshot, invalidate_snapshot, rpc_summary, bytes_summary, rpc_stats
+from tableIndex import get_arpIndex, get_macIndex
+from intCounters import collect_intInfo, get_intCounters, render_intCounters
+from topologyCache import TopologyCache, DEFAULT_TTL
+from sessionPool import SessionPool, DEFAULT_IDLE_TIMEOUT
+from counterSampler import sample_counters, read_counters, to_array, counter_changes
+from fabricSweep import sweep_fabric, DEFAULT_WORKERS
+from reportSinks import SINKS, open_sinks
+import rpcProfile
+from deviceBackend import JunosBackend, make_backend
 
 
+ICCP_FILTER = '<protocols><iccp/></protocols>'  # config subtree read by the ICCP functions in filtered mode
+
+mac_target = None  # used by get_phyIntFromArp/get_phyIntFromMac when no MAC is given
+
 # functions start #
 
 
@@ -15,37 +47,42 @@ def get_phyIntFromArp(device, target):
     :return: physical interface (string) of the device where the ip address is seen through ARP and MAC table
     '''
     global mac_target  # remove global var?
-    showArp = device.rpc.get_arp_table_information(no_resolve=True)
-    for i in showArp.xpath('arp-table-entry'):  # visit the list with the arp table
-        if (i.findtext('ip-address')) == target:  # if target ip is found in arp, save the mac associated
-            pprint("get_phyIntFromArp: device " + target + " has MAC " + i.findtext('mac-address'))
-            mac_target = i.findtext('mac-address')
+    mac = get_macFromArp(device, target)  # if target ip is found in arp, save the mac associated
+    if mac is not None:
+        pprint("get_phyIntFromArp: device " + target + " has MAC " + mac)
+        mac_target = mac
     if mac_target is None:  # if no mac is found set exit_code=1 and exit from function
         raise ValueError("get_phyIntFromArp: MAC not present")
-    showmac = device.rpc.get_ethernet_switching_table_information()
-    for p in showmac.iter('l2ng-mac-entry'):  # with the mac retrieved before, find the physical int associated
-        if (p.findtext('l2ng-l2-mac-address')) == mac_target:
-            interface = (p.findtext('l2ng-l2-mac-logical-interface')).split('.')
-            phy_interface = interface[0]
-            return phy_interface
+    # with the mac retrieved before, find the interface associated
+    logical = get_macIndex(device, mac_target).get_interface(mac_target)
+    if logical is not None:
+        return logical.split('.')[0]
     return "get_intFromArp: MAC presente in ARP ma non in ethernet-switching table"
 
 
-def get_phyIntFromMac(device):
+def get_phyIntFromMac(device, mac=None):
     '''
     :param device: jnpr.junos Device object
-    :return: physical interface (string) from where the MAC is seen (the MAC searched is the one in global variable
-             mac_target)
-    '''
-    showmac = device.rpc.get_ethernet_switching_table_information()
-    for p in showmac.iter('l2ng-mac-entry'):  # slides the ethernet-switching table
-        if (p.findtext('l2ng-l2-mac-address')) == mac_target: # if MAC is found
-            interface = (p.findtext('l2ng-l2-mac-logical-interface')).split('.')
-            phy_interface = interface[0]
-            return phy_interface
+    :param mac: MAC (string) to search, if None the MAC searched is the one in global variable mac_target
+    :return: physical interface (string) from where the MAC is seen
+    '''
+    if mac is None:
+        mac = mac_target
+    logical = get_macIndex(device, mac).get_interface(mac)
+    if logical is not None:  # if MAC is found
+        return logical.split('.')[0]
     return "get_intFromMac: MAC is present"
 
 
+def get_macFromArp(device, target):
+    '''
+    :param device: jnpr.junos Device object
+    :param target: target IP (string)
+    :return: MAC (string) of the target IP in the ARP table, None if it's not present
+    '''
+    return get_arpIndex(device, target).get(target)
+
+
 def isMacPresentFromArp(device, target):
     '''
     :param device: jnpr.junos Device object
@@ -53,16 +90,11 @@ def isMacPresentFromArp(device, target):
     :return: True if target device is found under MAC table (via ARP table>MAC table), False if it's not found under MAC
              table
     '''
-    mac_target = None
-    showArp = device.rpc.get_arp_table_information(no_resolve=True)
-    for i in showArp.xpath('arp-table-entry'):  # slides the arp table
-        # if it finds the target IP in the arp table, saves MAC and search for it in MAC table
-        if (i.findtext('ip-address')) == target:
-            mac = i.findtext('mac-address')
-            if isMacPresent(device,mac) is True:
-                return True
-    if mac_target is None:
-        return False
+    # if it finds the target IP in the arp table, search its MAC in MAC table
+    mac = get_macFromArp(device, target)
+    if mac is not None and isMacPresent(device, mac) is True:
+        return True
+    return False
 
 
 def isMacPresent(device, mac):
@@ -71,11 +103,7 @@ def isMacPresent(device, mac):
     :param mac: target MAC (string)
     :return: True if MAC is present under MAC table, False if not
     '''
-    showmac = device.rpc.get_ethernet_switching_table_information()
-    for p in showmac.iter('l2ng-mac-entry'):
-        if (p.findtext('l2ng-l2-mac-address')) == mac:
-            return True
-    return False
+    return get_macIndex(device, mac).get_interface(mac) is not None
 
 
 def get_lacpMembers(device, interface):
@@ -85,7 +113,7 @@ def get_lacpMembers(device, interface):
     :return: list of LACP memebers
     '''
     list = []
-    showlacp = device.rpc.get_lacp_interface_information()
+    showlacp = get_snapshot(device).rpc('get_lacp_interface_information')
     for i in showlacp.iter('lacp-interface-information'):
         if (i.findtext('lag-lacp-header/aggregate-name')) == interface:
             for p in i.iter('lag-lacp-protocol'):
@@ -98,7 +126,7 @@ def get_iccpPeerIP(device):
     :param device: jnpr.junos Device object
     :return: IP of the device ICCP peer
     '''
-    showiccp = device.rpc.get_config()
+    showiccp = get_snapshot(device).filtered_rpc('get_config', {'filter_xml': ICCP_FILTER})
     for i in showiccp.iter('iccp'):
         # select backup peer IP because it's the OoB, the main one is local to the devices
         x = i.findtext('peer/backup-liveness-detection/backup-peer-ip')
@@ -111,7 +139,7 @@ def isIccpPeerPresent(device):
     :return: True if backup ICCP peer is present, False if it's not
     '''
     x = None
-    showiccp = device.rpc.get_config()
+    showiccp = get_snapshot(device).filtered_rpc('get_config', {'filter_xml': ICCP_FILTER})
     for i in showiccp.iter('iccp'):
         x = i.findtext('peer/backup-liveness-detection/backup-peer-ip')
     if x is None:
@@ -126,7 +154,7 @@ def get_lldpMgmtIP(device, interface):
     :param interface: the interface (string) to look on for LLDP
     :return: remote management IP (string) of the device seen via LLDP on the interface selected
     '''
-    showlldp = device.rpc.get_lldp_interface_neighbors(interface_device=interface)
+    showlldp = get_snapshot(device).rpc('get_lldp_interface_neighbors', interface_device=interface)
     mgmt_ip = showlldp.findtext('lldp-neighbor-information/lldp-remote-management-address')
     return mgmt_ip
 
@@ -136,293 +164,1038 @@ def save_intErrors(device, interface, file):
     :param device: jnpr.junos Device object
     :param interface: interface (string) where we need to extract errors, could be both physical and LACP
     :param file: file object that has been opened, to write on the interface's errors
-    :return: it doesn't return a value but writes on the file all the wanted info
-    '''
-    intInfo = device.rpc.get_interface_information(interface_name=interface, extensive=True)
-
-    file.write("\n" + interface + "\nInput error list:\n")
-    input_errors = intInfo.findtext('physical-interface/input-error-list/input-errors')
-    input_drops = intInfo.findtext('physical-interface/input-error-list/input-drops')
-    framing_errors = intInfo.findtext('physical-interface/input-error-list/framing-errors')
-    input_runts = intInfo.findtext('physical-interface/input-error-list/input-runts')
-    file.write("\tinput-errors: " + input_errors + "\n\tinput-drops: " + input_drops + "\n\tframing-errors: " +
-               framing_errors + "\n\tinput runts: " + input_runts + "\n")
-    if interface.startswith("ae") == True:  # if aggregate
-        input_giants = intInfo.findtext('physical-interface/input-error-list/input-giants')
-        input_discards = intInfo.findtext('physical-interface/input-error-list/input-discards')
-        file.write("\tinput-giants: " + input_giants + "\n\tinput-discards: " + input_discards + "\n")
-    else:  # else, it's physical interface
-        input_discards = intInfo.findtext('physical-interface/input-error-list/input-discards')
-        input_l3_incompletes = intInfo.findtext('physical-interface/input-error-list/input-l3-incompletes')
-        input_l2_channel_errors = intInfo.findtext('physical-interface/input-error-list/input-l2-channel-errors')
-        input_l2_mismatch_timeouts = intInfo.findtext('physical-interface/input-error-list/input-l2-mismatch-timeouts')
-        input_fifo_errors = intInfo.findtext('physical-interface/input-error-list/input-fifo-errors')
-        file.write("\tinput-discards: " + input_discards + "\n\tinput-l3-incompletes: " + input_l3_incompletes +
-                   "\n\tinput-l2-channel-errors: " + input_l2_channel_errors + "\n\tinput-l2-mismatch-timeouts: " +
-                   input_l2_mismatch_timeouts + "\n\tinput-fifo-errors: " + input_fifo_errors + "\n")
-    input_resource_errors = intInfo.findtext('physical-interface/input-error-list/input-resource-errors')
-    file.write("\tinput-resource-errors: " + input_resource_errors + "\n")
-
-    file.write("Output error list:\n")
-    carrier_transitions = intInfo.findtext('physical-interface/output-error-list/carrier-transitions')
-    output_errors = intInfo.findtext('physical-interface/output-error-list/output-errors')
-    file.write("\tcarrier-transitions: " + carrier_transitions + "\n\toutput-errors: " + output_errors + "\n")
-    if interface.startswith("ae") == True:  # if aggregate
-        output_drops = intInfo.findtext('physical-interface/output-error-list/output-drops')
-        mtu_errors = intInfo.findtext('physical-interface/output-error-list/mtu-errors')
-        file.write("\toutput-drops: " + output_drops + "\n\tmtu-errors: " + mtu_errors + "\n")
-    else:  # else, it's physical interface
-        output_collisions = intInfo.findtext('physical-interface/output-error-list/output-collisions')
-        output_drops = intInfo.findtext('physical-interface/output-error-list/output-drops')
-        aged_packets = intInfo.findtext('physical-interface/output-error-list/aged-packets')
-        mtu_errors = intInfo.findtext('physical-interface/output-error-list/mtu-errors')
-        hs_link_crc_errors = intInfo.findtext('physical-interface/output-error-list/hs-link-crc-errors')
-        output_fifo_errors = intInfo.findtext('physical-interface/output-error-list/output-fifo-errors')
-        file.write(
-            "\toutput-collisions: " + output_collisions + "\n\toutput-drops: " + output_drops + "\n\taged-packets: " +
-            aged_packets + "\n\tmtu-errors: " + mtu_errors + "\n\ths-link-crc-errors: " + hs_link_crc_errors +
-            "\n\toutput-fifo-errors: " + output_fifo_errors + "\n")
-    output_resource_errors = intInfo.findtext('physical-interface/output-error-list/output-resource-errors')
-    file.write("\toutput-resource-errors: " + output_resource_errors + "\n")
-
-    file.write("Queue counters errors:\n")
-    for i in intInfo.iter('queue'):
-        forwarding_class_name = i.findtext('forwarding-class-name')
-        queue_counters_total_drop_packets = i.findtext('queue-counters-total-drop-packets')
-        file.write("\t" + forwarding_class_name + " drops: " + queue_counters_total_drop_packets + "\n")
-    if interface.startswith("ae") == False:
-        bit_error_seconds = intInfo.findtext('physical-interface/ethernet-pcs-statistics/bit-error-seconds')
-        errored_blocks_seconds = intInfo.findtext('physical-interface/ethernet-pcs-statistics/errored-blocks-seconds')
-        file.write("ethernet-pcs-statistics:\n\tbit-error-seconds: " + bit_error_seconds +
-                   "\n\terrored-blocks-seconds: " + errored_blocks_seconds + "\n")
-
-        fec_ccw_error_rate = intInfo.findtext('physical-interface/ethernet-fec-statistics/fec_ccw_error_rate')
-        fec_nccw_error_rate = intInfo.findtext('physical-interface/ethernet-fec-statistics/fec_nccw_error_rate')
-        file.write("ethernet-fec-statistics:\n\tfec_ccw_error_rate: " + fec_ccw_error_rate +
-                   "\n\tfec_nccw_error_rate: " + fec_nccw_error_rate + "\n")
-
-        input_crc_errors = intInfo.findtext('physical-interface/ethernet-mac-statistics/input-crc-errors')
-        output_crc_errors = intInfo.findtext('physical-interface/ethernet-mac-statistics/output-crc-errors')
-        input_fifo_errors = intInfo.findtext('physical-interface/ethernet-mac-statistics/input-fifo-errors')
-        output_fifo_errors = intInfo.findtext('physical-interface/ethernet-mac-statistics/output-fifo-errors')
-        file.write("ethernet-mac-statistics:\n\tinput-crc-errors: " + input_crc_errors + "\n\toutput-crc-errors: " +
-                   output_crc_errors +"\n\tinput-fifo-errors: " + input_fifo_errors + "\n\toutput-fifo-errors: " +
-                   output_fifo_errors + "\n")
-    file.flush()
+    :return: it doesn't return a value but writes on the file all the wanted info (buffered, no flush)
+    '''
+    file.write(render_intCounters(get_intCounters(device, interface)))
 
 
-# functions end
+class Trace:
+    '''
+    One target IP traced through the cascade
+    '''
+    __slots__ = ('ip', 'mac', 'report', 'via', 'forks', 'path', 'tiers', 'counters')
 
+    def __init__(self, ip):
+        '''
+        :param ip: target IP (string)
+        '''
+        self.ip = ip
+        self.mac = None  # found via ARP on the first tier
+        self.report = []  # text of the tiers crossed by the target, in order
+        self.via = []  # (parent IP, interface) of the cached adjacencies used to reach the current tier
+        self.forks = []  # Trace objects of the other branches of the path, see fork()
+        self.path = []  # (mgmt IP, hostname, interface names) of the devices where the target has been seen
+        self.tiers = []  # index in path of the first device of each tier
+        self.counters = {}  # (mgmt IP, interface) -> InterfaceCounters of the interfaces in path
 
-exit_code = False  # used as escape variable to block the device scan
-mac_target = None  # it will contain the MAC to be searched
-#ip_device1 = "" #commented out since acquired via input below
-ip_device2 = None
-
-timenow = str(datetime.now().strftime("%d-%m-%Y %H-%M-%S"))
-txtfile = open("Report " + timenow + ".txt", "w")  # open file named with the hour
-ip_device1=input("Insert your core management IP: ")
-user = input("Username: ")
-password = getpass("Password: ")
-target_ip = input("Insert target IP: ")
-txtfile.write(str(datetime.now().time()) + " REPORT IP " + target_ip + " starting from " + ip_device1 + "\n")
-
-# ___________________________first dig where L3 resides________________________________#
-device1 = Device(host=ip_device1, user=user, password=password, port=22)
-try:  # open connection to the first device
-    device1.open(normalize=True)
-    pprint("Connected to device " + device1.facts['hostname'] + "(" + ip_device1 + ")")
-    txtfile.write("\n" + str(datetime.now().time()) + " Connected to device " + device1.facts['hostname'] + "(" +
-                  ip_device1 + ")\n")
-except:
-    sys.exit("Script aborted, There was a problem connecting to device " + ip_device1)
-
-try:
-    # check if MAC of the target is present under one of the two core
-    if isMacPresentFromArp(device1, target_ip) == True or \
-            (isIccpPeerPresent(device1) == True and isMacPresentFromArp(get_iccpPeerIP(device1), target_ip) == True) \
-            == True:
-
-        #save intErrors from device1 (of the interface that sees the target IP)
-        try:
-            physical1 = get_phyIntFromArp(device1, target_ip)
-        except ValueError as error:
-            pprint(device1.facts['hostname'] + error)
-            txtfile.write(str(datetime.now().time()) +
-                          " It's not possible to find the corresponding MAC via arp on the device " +
-                          device1.facts['hostname'] + "(" + ip_device1 + ")\n")
-        save_intErrors(device1, physical1, txtfile)
-
-        #if aggregate, save intErrors from device1 of the interfaces part of the LACP (that points the target IP) and
-        #saves mgmt IP of the child device, else only saves mgmt IP of the child device
-        if physical1.startswith("ae") == True:
-            list_int = get_lacpMembers(device1, physical1)
-            for i in range(len(list_int)):  # saves intErrors of each physical interfaces part of the aggregate
-                save_intErrors(device1, list_int[i], txtfile)
-            mgmt_child1 = get_lldpMgmtIP(device1, list_int[0])  # saves mgmt IP of the child from aggregate
+    def fork(self, note):
+        '''
+        :param note: first line (string) of the report of the branch
+        :return: Trace object of the same target that follows another branch, its report comes after this one
+        '''
+        branch = Trace(self.ip)
+        branch.mac = self.mac
+        branch.path = list(self.path)
+        branch.tiers = list(self.tiers)
+        branch.counters = dict(self.counters)
+        branch.report.append(note)
+        self.forks.append(branch)
+        return branch
+
+    def text(self):
+        '''
+        :return: report (string) of the target, the branches follow the path they forked from
+        '''
+        return "".join(self.report) + "".join(branch.text() for branch in self.forks)
+
+    def full_path(self):
+        '''
+        :return: list of (mgmt IP, hostname, interface names) of the path and of its branches
+        '''
+        return self.path + [hop for branch in self.forks for hop in branch.full_path()]
+
+
+class DeviceDig:
+    '''
+    What has been found on one device for the targets that reached it
+    '''
+    __slots__ = ('ip', 'hostname', 'header', 'results', 'interfaces')
+
+    def __init__(self, ip, header):
+        '''
+        :param ip: management IP (string) of the device
+        :param header: text (string) of the connection to the device
+        '''
+        self.ip = ip
+        self.hostname = None
+        self.header = header
+        self.results = {}  # Trace -> tuple (mac, physical interface towards the target, None if MAC not seen)
+        # physical interface -> tuple (text, mgmt_child, via, names, counters) returned by Cascade.dig_interface
+        self.interfaces = {}
+
+    def text(self, trace):
+        '''
+        :param trace: Trace object
+        :return: text (string) of the device in the report of the target
+        '''
+        if trace not in self.results:  # it wasn't possible to connect to the device
+            return self.header
+        physical = self.results[trace][1]
+        if physical is None:
+            return (self.header + str(datetime.now().time()) + " Target MAC not present on the device " +
+                    self.hostname + "(" + self.ip + ")\n")
+        return self.header + self.interfaces[physical][0]
+
+    def combined_text(self):
+        '''
+        :return: text (string) of the device in the combined report, each interface is written once followed by the
+                 targets seen through it
+        '''
+        text = self.header
+        for physical, (interfaces_text, mgmt_child, via, names, counters) in self.interfaces.items():
+            targets = [trace.ip for trace, result in self.results.items() if result[1] == physical]
+            text += str(datetime.now().time()) + " Targets " + ", ".join(targets) + " via " + physical + "\n"
+            text += interfaces_text
+        missing = [trace.ip for trace, result in self.results.items() if result[1] is None]
+        if len(missing) > 0:
+            text += (str(datetime.now().time()) + " Targets " + ", ".join(missing) + " not present on the device " +
+                     self.hostname + "(" + self.ip + ")\n")
+        return text
+
+    def child(self, trace):
+        '''
+        :param trace: Trace object
+        :return: mgmt IP (string) of the child device towards the target, None if there isn't one
+        '''
+        physical = self.results.get(trace, (None, None))[1]
+        if physical is None:
+            return None
+        return self.interfaces[physical][1]
+
+    def via(self, trace):
+        '''
+        :param trace: Trace object
+        :return: tuple (mgmt IP, interface) if the child towards the target comes from the topology cache, else None
+        '''
+        physical = self.results.get(trace, (None, None))[1]
+        if physical is None:
+            return None
+        return self.interfaces[physical][2]
+
+
+def describe_path(path):
+    '''
+    :param path: list of (mgmt IP, hostname, interface names) of Trace.path
+    :return: text (string) of the path, e.g. "core1(10.0.0.1) ae1 > access1(10.1.0.1) ge-0/0/1"
+    '''
+    return " > ".join(hostname + "(" + ip + ") " + names[0] for ip, hostname, names in path) or "empty"
+
+
+def merge_forks(traces, traces_peer):
+    '''
+    :param traces: list of Trace objects that reached a device
+    :param traces_peer: list of Trace objects that reached its ICCP peer, dug in the same tier
+    :return: list of the Trace objects of traces_peer to add to the tier; the forks of a trace in traces are dropped,
+             they only went to the other side of the same tier
+    '''
+    merged = []
+    for trace in traces_peer:
+        parent = next((t for t in traces if trace in t.forks), None)
+        if parent is not None:
+            parent.forks.remove(trace)
         else:
-            mgmt_child1 = get_lldpMgmtIP(device1, physical1)  # saves mgmt IP of the child from physical interface
-        if mgmt_child1 != None:  # if there is mgmt child
-            child1_present = True
+            merged.append(trace)
+    return merged
 
-        if isIccpPeerPresent(device1) == True: #if ICCP peer is present, it follows the same procedure as above
-            ip_device2 = get_iccpPeerIP(device1)
-            device2 = Device(host=ip_device2, user=user, password=password, port=22)
-            try:
-                device2.open(normalize=True)
-                pprint("Connected to device " + device2.facts['hostname'] + "(" + get_iccpPeerIP(device1) + ")")
-                txtfile.write("\n" + str(datetime.now().time()) + " Connected to device " + "(" +
-                              device2.facts['hostname'] + ")\n")
-            except ConnectionError as error:
-                pprint("There was a problem connecting to device " + ip_device2)
-                txtfile.write("\n" + str(datetime.now().time()) + " There was a problem connecting to device " +
-                              ip_device2 + "\n\n")
-            # save intErrors from device1 peer (of the interface that sees the target IP)
-            try:
-                physical2 = get_phyIntFromArp(device2, target_ip)
-            except ValueError as error:
-                pprint(device2.facts['hostname'] + error)
-                txtfile.write(str(datetime.now().time()) +
-                              " It's not possible to find the corresponding MAC via arp on the device " +
-                              device2.facts['hostname'] + "(" + ip_device2 + ")\n")
-            save_intErrors(device2, physical2, txtfile)
-
-            # if aggregate, save intErrors from device1 peer, of the interfaces part of the LACP (that points the
-            # target IP) and saves mgmt IP of the child device, else only saves mgmt IP of the child device
-            if physical2.startswith("ae") == True:
-                list_int = get_lacpMembers(device2, physical2)
-                for i in range(len(list_int)):
-                    save_intErrors(device2, list_int[i], txtfile)
-                mgmt_child2 = get_lldpMgmtIP(device2, list_int[0])
-            if mgmt_child2 != None: # if there is mgmt child
-                child2_present = True
-
-        # if child towards the target IP are present, save their mgmt to connect later,
-        # else only close the currect connection and end the script
-        if (child1_present == True or child2_present == True):
-            # if one of the child is present, save its IP into ip_device1 (which will be the next starting point to
-            # dig further)
-            if child1_present == True:
-                ip_device1 = mgmt_child1
-            if child2_present == True:
-                ip_device1 = mgmt_child2
+
+def read_targets(source):
+    '''
+    :param source: path (string) of a file with one target IP per line, '-' to read them from stdin
+    :return: list of target IPs (string), empty lines and lines starting with # are skipped
+    '''
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source) as file:
+            lines = file.read().splitlines()
+    targets = []
+    for line in lines:
+        line = line.strip()
+        if line != "" and not line.startswith("#") and line not in targets:
+            targets.append(line)
+    return targets
+
+
+class Cascade:
+    '''
+    Traces of the targets starting from a core, with the sessions and the caches shared by every call
+    '''
+
+    def __init__(self, core, user=None, password=None, backend=None, parallel=False, all_branches=False,
+                 concurrency=4, topology_cache=None, topology_ttl=DEFAULT_TTL, refresh_topology=False,
+                 session_idle=DEFAULT_IDLE_TIMEOUT, filtered=False, stream=False, verbose=True):
+        '''
+        :param core: management IP (string) of the core, where L3 resides
+        :param user: username (string)
+        :param password: password (string), None for the SSH keys or for backends without credentials
+        :param backend: object that creates the devices (see deviceBackend), None for the real devices
+        :param parallel: if True the two ICCP peers of each tier are handled at the same time
+        :param all_branches: if True every child of every tier is followed, the branches are dug concurrently
+        :param concurrency: with all_branches, maximum number of tiers dug at the same time
+        :param topology_cache: path (string) of the JSON file of the ICCP/LLDP adjacencies, None to discover them
+        :param topology_ttl: seconds after which a cached adjacency is discovered again
+        :param refresh_topology: if True every adjacency is discovered again
+        :param session_idle: seconds after which an unused device session is closed
+        :param filtered: if True the devices are asked only the ARP/MAC entries and the ICCP config needed
+        :param stream: if True a single ARP/MAC lookup parses the raw reply and stops at its entry (replayed and
+                       synthetic devices)
+        :param verbose: if False nothing is printed, the results are only returned
+        '''
+        self.core = core
+        self.user = user
+        self.password = password
+        self.backend = backend if backend is not None else JunosBackend()
+        self.all_branches = all_branches
+        self.concurrency = concurrency
+        self.filtered = filtered  # modes of the snapshots of the devices taken by this run
+        self.stream = stream
+        self.verbose = verbose
+        self.topology = None
+        self.preopen_executor = None  # opens in advance the connections of the devices known from the topology cache
+        self.preopened = {}  # mgmt IP -> future of pool.acquire
+        self.preopened_lock = threading.Lock()
+        if topology_cache is not None:
+            self.topology = TopologyCache(topology_cache, topology_ttl, refresh_topology)
+            self.preopen_executor = ThreadPoolExecutor(max_workers=4)
+        # one session per device, reused when it's touched again
+        self.pool = SessionPool(self.connect_device, session_idle)
+        # mgmt IP -> names of the rpc whose filter the device refused, the snapshots are dropped at every hop
+        self.rejected = {}
+        # the worker handles the ICCP peer, one per tier dug at the same time
+        self.executor = ThreadPoolExecutor(max_workers=concurrency if all_branches else 1) if parallel else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def log(self, message):
+        '''
+        :param message: progress message (string), printed only if verbose
+        '''
+        if self.verbose is True:
+            pprint(message)
+
+    def trace(self, targets, combined=None):
+        '''
+        :param targets: list of target IPs (string) or of Trace objects, traced together
+        :param combined: list where the text of every device is appended once (combined report), None if not needed
+        :return: list of Trace objects with the report, the path and the counters of each target; Trace objects given
+                 in targets keep what has been found even if the trace is interrupted by an exception
+        '''
+        traces = [target if isinstance(target, Trace) else Trace(target) for target in targets]
+        # first dig where L3 resides, the target MAC is found via ARP, then the dig continues via MAC table
+        if self.all_branches is True:
+            import asyncio  # only the concurrent walk of the branches needs the event loop
+            asyncio.run(self.dig_graph(self.core, traces, combined, self.executor, self.concurrency))
         else:
-            exit_code = True
+            self.dig_cascade(self.core, traces, combined, self.executor)
+        return traces
 
-        #close connection with the devices
-        try:
-            device1.close()
-        except ConnectionError as error:
-            pprint(error)
+    def sample(self, traces, samples, interval):
+        '''
+        :param traces: list of Trace objects already traced
+        :param samples: number (integer) of samples
+        :param interval: seconds between two samples
+        :return: counterSampler.CounterSamples object of the interfaces on the path of the traces and their branches
+        '''
+        # the path is known, only its counters are read again, without looking for the targets
+        path = [hop for trace in traces for hop in trace.full_path()]
+        self.log("Sampling the counters of " + str(len(path)) + " devices on the path, " + str(samples) +
+                 " samples every " + str(interval) + " s")
+        return sample_counters(path, samples, interval, self.acquire_device, self.close_device)
+
+    def sweep(self, workers=DEFAULT_WORKERS, processes=None):
+        '''
+        :param workers: number of devices collected at the same time
+        :param processes: number of parsing processes, None for the number of CPUs
+        :return: fabricSweep.SweepResult object of every switch reachable from the core
+        '''
+        return sweep_fabric(self.core, self.acquire_device, self.close_device, self.sweep_neighbors, workers,
+                            processes)
+
+    def close(self):
+        '''
+        :return: None, the worker threads are stopped, the sessions closed and the topology cache saved
+        '''
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.preopen_executor is not None:
+            self.close_preopened()
+            self.preopen_executor.shutdown()
+        self.pool.close()
+        if self.topology is not None:
+            self.topology.save()
+
+    def connect_device(self, ip):
+        '''
+        :param ip: management IP (string) of the device
+        :return: jnpr.junos Device object already opened, None if it wasn't possible to connect
+        '''
+        device = self.backend.device(ip, self.user, self.password)
         try:
-            device2.close()
-        except ConnectionError as error:
-            pprint(error)
+            if rpcProfile.profiler is None:
+                device.open(normalize=True)
+            else:
+                rpcProfile.profiler.connect(device, ip)  # open and facts are timed
+        except Exception:
+            return None
+        return device
 
-        txtfile.flush()
+    def preopen_device(self, ip):
+        '''
+        :param ip: management IP (string) of a device that is going to be dug (known from the topology cache)
+        :return: None, the connection is opened in background and taken by open_device
+        '''
+        if self.preopen_executor is None or ip is None:
+            return
+        with self.preopened_lock:
+            if ip not in self.preopened:
+                self.preopened[ip] = self.preopen_executor.submit(self.pool.acquire, ip)
 
-    else:  # target MAC not found on both core
-        device1.close()
-        pprint("target MAC/device not present under these devices")
-        exit_code = True
+    def close_preopened(self):
+        '''
+        :return: None, the connections opened in advance and never used (the path went elsewhere) are closed
+        '''
+        with self.preopened_lock:
+            futures = list(self.preopened.values())
+            self.preopened.clear()
+        for future in futures:
+            device = future.result()
+            if device is not None:
+                self.close_device(device)
 
-except:
-    sys.exit("Undefined Error")
-# ___________________________end of first dig (where L3 resides)________________________________#
+    def acquire_device(self, ip, filtered=None):
+        '''
+        :param ip: management IP (string) of the device
+        :param filtered: filtered mode of the hop, None for the one of the run
+        :return: jnpr.junos Device object already opened (the one opened in advance, if any), with a new snapshot,
+                 None if it wasn't possible to connect
+        '''
+        with self.preopened_lock:
+            future = self.preopened.pop(ip, None)
+        device = future.result() if future is not None else self.pool.acquire(ip)
+        if device is not None:
+            open_snapshot(device, self.filtered if filtered is None else filtered, self.stream,
+                          self.rejected.setdefault(ip, set()))
+        return device
 
-# Since the core of this section is the same as the one above (the difference is that in the one above starts from ARP
-# and the one below from MAC) I've avoided to repeat the comments, the operations are the same (I should consider
-# to re-organize the code to avoid this big repetition)
+    def open_device(self, ip, report):
+        '''
+        :param ip: management IP (string) of the device
+        :param report: file object where the connection is logged
+        :return: jnpr.junos Device object already opened, None if it wasn't possible to connect
+        '''
+        device = self.acquire_device(ip)
+        if device is None:
+            self.log("There was a problem connecting to device " + ip)
+            report.write("\n" + str(datetime.now().time()) + " There was a problem connecting to device " + ip +
+                         "\n\n")
+            return None
+        self.log("Connected to device " + device.facts['hostname'] + "(" + ip + ")")
+        report.write("\n" + str(datetime.now().time()) + " Connected to device " + device.facts['hostname'] + "(" +
+                     ip + ")\n")
+        return device
 
-while exit_code is False:  #since it remains False, the dig continue
-    child1_present = False
-    child2_present = False
-    device1 = Device(host=ip_device1, user=user, password=password, port=22)
-    try:
-        device1.open(normalize=True)
-        pprint("Connected to device " + device1.facts['hostname'] + "(" + ip_device1 + ")")
-        txtfile.write("\n" + str(datetime.now().time()) + " Connected to device " + device1.facts['hostname'] +
-                      "(" + ip_device1 + ")\n")
-    except ConnectionError:
-        pprint("There was a problem connecting to device " + ip_device1)
-        txtfile.write("\n" + str(datetime.now().time()) + " There was a problem connecting to device " +
-                      ip_device1 + "\n\n")
-        exit_code = True
-        break
-
-    # check if MAC is present under one of the two device
-    if isMacPresent(device1, mac_target) == True or \
-            (isIccpPeerPresent(device1) == True and isMacPresent(get_iccpPeerIP(device1), mac_target) == True) == True:
+    def close_device(self, device):
+        '''
+        :param device: jnpr.junos Device object
+        :return: None, the snapshot of the hop is dropped and the session given back to the pool
+        '''
+        invalidate_snapshot(device)  # the hop is over, next time the tables must be fetched again
+        self.pool.release(device)
+
+    def get_peerIP(self, device, ip):
+        '''
+        :param device: jnpr.junos Device object
+        :param ip: management IP (string) of the device
+        :return: IP (string) of the ICCP peer, None if there isn't one; saved in the topology cache if present
+        '''
+        peer = get_iccpPeerIP(device) if isIccpPeerPresent(device) == True else None
+        if self.topology is not None:
+            self.topology.set_peer(ip, peer)
+        return peer
 
+    def resolve_peer(self, ip):
+        '''
+        :param ip: management IP (string) of a device that is going to be dug
+        :return: IP (string) of the ICCP peer, None if there isn't one or it wasn't possible to connect; the device
+                 opened to ask it is kept for the dig of the tier (taken by open_device like the connections opened in
+                 advance)
+        '''
+        hit, peer = self.topology.get_peer(ip) if self.topology is not None else (False, None)
+        if hit is True:
+            return peer
+        device = self.acquire_device(ip)
         try:
-            physical1 = get_phyIntFromMac(device1)
-        except ValueError as error:
-            pprint(device1.facts['hostname'] + error)
-            txtfile.write(str(datetime.now().time()) +
-                          " It's not possible to find the corresponding MAC via arp on the device " +
-                          device1.facts['hostname'] + "(" + ip_device1 + ")\n")
-        save_intErrors(device1, physical1, txtfile)
-
-        if physical1.startswith("ae") == True:
-            list_int = get_lacpMembers(device1, physical1)
-            for i in range(len(list_int)):
-                save_intErrors(device1, list_int[i], txtfile)
-            mgmt_child1 = get_lldpMgmtIP(device1, list_int[0])
-        else:
-            mgmt_child1 = get_lldpMgmtIP(device1, physical1)
-        if mgmt_child1 != None:
-            child1_present = True
+            peer = self.get_peerIP(device, ip) if device is not None else None
+        finally:
+            opened = Future()
+            opened.set_result(device)
+            with self.preopened_lock:
+                self.preopened[ip] = opened
+        return peer
 
-        if isIccpPeerPresent(device1) == True:
-            ip_device2 = get_iccpPeerIP(device1)
-            device2 = Device(host=ip_device2, user=user, password=password, port=22)
-            try:
-                device2.open(normalize=True)
-                pprint("Connected to device " + device2.facts['hostname'] + "(" + get_iccpPeerIP(device1) + ")")
-                txtfile.write("\n" + str(datetime.now().time()) + " Connected to device " + "(" + device2.facts['hostname'] + ")\n")
-            except ConnectionError as error:
-                pprint("There was a problem connecting to device " + ip_device2)
-                txtfile.write("\n" + str(datetime.now().time()) + " There was a problem connecting to device " + ip_device2 + "\n\n")
+    def get_childIP(self, device, ip, interface):
+        '''
+        :param device: jnpr.junos Device object
+        :param ip: management IP (string) of the device
+        :param interface: the interface (string) to look on for LLDP
+        :return: tuple (mgmt IP of the child seen via LLDP or None, True if it comes from the topology cache)
+        '''
+        if self.topology is not None:
+            hit, child = self.topology.get_child(ip, interface)
+            if hit is True:
+                # the next tier is connected while the counters of this one are collected
+                self.preopen_device(child)
+                return child, True
+        child = get_lldpMgmtIP(device, interface)
+        if self.topology is not None:
+            self.topology.set_child(ip, interface, child)
+        return child, False
+
+    def revalidate_child(self, via):
+        '''
+        :param via: tuple (mgmt IP of the parent device, interface towards the child) of a cached adjacency
+        :return: mgmt IP (string) of the child seen now via LLDP, None if there isn't one or it wasn't possible to
+                 connect
+        '''
+        parent, interface = via
+        self.topology.forget_child(parent, interface)
+        header = io.StringIO()
+        device = self.open_device(parent, header)
+        if device is None:
+            return None
+        try:
+            child = get_lldpMgmtIP(device, interface)
+        finally:
+            self.close_device(device)
+        self.topology.set_child(parent, interface, child)
+        return child
+
+    def dig_interface(self, device, ip, physical):
+        '''
+        :param device: jnpr.junos Device object
+        :param ip: management IP (string) of the device
+        :param physical: physical or aggregate interface (string) towards one or more targets
+        :return: tuple (text, mgmt_child, via, names, counters): text is the report of the interface errors,
+                 mgmt_child the mgmt IP (string) of the child device seen via LLDP (None if there isn't one), via is
+                 (ip, LLDP interface) if mgmt_child comes from the topology cache, else None, names the list of
+                 interfaces in the text and counters their InterfaceCounters records, in the same order
+        '''
+        # if aggregate, save intErrors of the interfaces part of the LACP (that points the target) and mgmt IP of the
+        # child device seen from the first member, else only mgmt IP of the child device seen from the physical
+        # interface
+        lldp_interface = physical
+        list_int = []
+        if physical.startswith("ae") == True:
+            list_int = get_lacpMembers(device, physical) or []
+            lldp_interface = list_int[0] if len(list_int) > 0 else None
+        # the child is looked before the counters, so a cached one can be connected while the counters are collected
+        mgmt_child, cached = (self.get_childIP(device, ip, lldp_interface) if lldp_interface is not None else
+                              (None, False))
+        names = [physical] + list_int
+        if len(list_int) > 0:
+            collect_intInfo(device, names)  # counters of the aggregate and its members in one RPC
+        counters = [get_intCounters(device, name) for name in names]
+        # the text of the interfaces is joined once, the report is written when the trace is over
+        text = "".join(render_intCounters(record) for record in counters)
+        return text, mgmt_child, (ip, lldp_interface) if cached is True else None, names, counters
+
+    def dig_device(self, device, dig, traces, first):
+        '''
+        :param device: jnpr.junos Device object already opened
+        :param dig: DeviceDig object of the device, filled with the results
+        :param traces: list of Trace objects that reached the device
+        :param first: True on the first tier, where the MAC of the targets is found via ARP, on the following tiers the
+                      MAC is searched directly in the MAC table
+        :return: the DeviceDig object
+        '''
+        dig.hostname = device.facts['hostname']
+        if len(traces) > 1:
+            # one snapshot of the tables for all the targets, the lookups below are served from it even in filtered
+            # mode
+            if first:
+                get_arpIndex(device)
+            get_macIndex(device)
+        for trace in traces:
+            mac = trace.mac
+            if first:
+                mac = get_macFromArp(device, trace.ip) or mac
+            if mac is None or isMacPresent(device, mac) is False:
+                dig.results[trace] = (mac, None)
+                continue
+            physical = get_phyIntFromMac(device, mac)
+            if physical not in dig.interfaces:  # an interface shared by several targets is collected only once
+                dig.interfaces[physical] = self.dig_interface(device, dig.ip, physical)
+            dig.results[trace] = (mac, physical)
+        return dig
+
+    def dig_peer(self, ip, traces, first):
+        '''
+        :param ip: management IP (string) of the ICCP peer
+        :param traces: same as dig_device
+        :param first: same as dig_device
+        :return: DeviceDig object of the peer (without results if it wasn't possible to connect)
+        '''
+        header = io.StringIO()
+        device = self.open_device(ip, header)
+        dig = DeviceDig(ip, header.getvalue())
+        if device is None:
+            return dig
+        try:
+            return self.dig_device(device, dig, traces, first)
+        finally:
+            self.close_device(device)
+
+    def dig_tier(self, ip, traces, first, pending, executor=None, branches=False, peer=None):
+        '''
+        :param ip: management IP (string) of the device of the tier reached from the upper one
+        :param traces: list of Trace objects that reached the tier
+        :param first: same as dig_device
+        :param pending: dict mgmt IP -> list of Trace objects of the tiers still to dig at this depth, if the ICCP
+                        peer is one of them its targets are merged here, so each switch is connected only once
+        :param executor: concurrent.futures executor, if present the ICCP peer is handled at the same time of the
+                         device
+        :param branches: if True every child of the tier is followed (a fork of the trace goes on each one), else
+                         only the child seen by the last device of the tier
+        :param peer: tuple (True, mgmt IP of the ICCP peer dug with the device or None) if the caller has already
+                     resolved it, None to look it up in the topology cache or on the device
+        :return: tuple (digs, children): digs is the list of DeviceDig of the tier in report order, children is a
+                 dict mgmt IP of the next tier -> list of Trace objects to dig there
+        '''
+        if peer is None:
+            peer = self.topology.get_peer(ip) if self.topology is not None else (False, None)
+        hit, ip_device2 = peer
+        if hit is True:
+            # the peer is known, its connection is opened together with the device one
+            self.preopen_device(ip_device2)
+        header = io.StringIO()
+        device1 = self.open_device(ip, header)
+        dig1 = DeviceDig(ip, header.getvalue())
+        digs = [dig1]
+        # an unreachable device ends the tier: the loop below writes it in the report and, if the tier comes from the
+        # topology cache, checks the adjacency again (a renumbered or removed switch)
+        if device1 is not None:
+            future = None
             try:
-                physical2 = get_phyIntFromMac(device2)
-            except ValueError as error:
-                pprint(device2.facts['hostname'] + error)
-                txtfile.write(str(datetime.now().time()) +
-                              " It's not possible to find the corresponding MAC via arp on the device " +
-                              device2.facts['hostname'] + "(" + ip_device2 + ")\n")
-            save_intErrors(device2, physical2, txtfile)
-            if physical2.startswith("ae") == True:
-                list_int = get_lacpMembers(device2, physical2)
-                for i in range(len(list_int)):
-                    save_intErrors(device2, list_int[i], txtfile)
-                mgmt_child2 = get_lldpMgmtIP(device2, list_int[0])
-            if mgmt_child2 != None:
-                child2_present = True
-            else:
-                mgmt_child2 = get_lldpMgmtIP(device2, physical2)
-
-        if (child1_present == True or child2_present == True):
-            if child1_present == True:
-                ip_device1 = mgmt_child1
-            if child2_present == True:
-                ip_device1 = mgmt_child2
-            if child1_present != True or child2_present != True:
-                exit_code = True
-        else:
-            exit_code = True
+                if hit is False:
+                    ip_device2 = self.get_peerIP(device1, ip)
+                if ip_device2 is not None:
+                    traces = traces + pending.pop(ip_device2, [])
+                    if executor is not None:
+                        future = executor.submit(self.dig_peer, ip_device2, traces, first)
+                self.dig_device(device1, dig1, traces, first)
+            finally:
+                self.close_device(device1)
+            if future is not None:
+                digs.append(future.result())
+            elif ip_device2 is not None:
+                digs.append(self.dig_peer(ip_device2, traces, first))
+
+        children = {}
+        revalidated = {}  # (parent IP, interface) -> child seen now via LLDP, each cached adjacency is checked once
+        for trace in traces:
+            trace.report.append("".join(dig.text(trace) for dig in digs))
+            found = [dig for dig in digs if dig.results.get(trace, (None, None))[1] is not None]
+            parents = [via[0] for via in trace.via]
+            if len(trace.via) > 0 and all(dig.child(trace) is None or dig.child(trace) in parents for dig in found):
+                # the tier comes from the topology cache and it's unreachable, the MAC isn't there, it's learned on the
+                # port back towards the parent or there is no next hop: the adjacencies are checked again
+                mgmt_child = None
+                for via in trace.via:
+                    if via not in revalidated:
+                        revalidated[via] = self.revalidate_child(via)
+                    mgmt_child = revalidated[via] or mgmt_child
+                trace.via = []
+                if mgmt_child is not None and mgmt_child not in [dig.ip for dig in digs]:
+                    trace.report.append("\n" + str(datetime.now().time()) + " Topology cache out of date, the path " +
+                                        "continues on " + mgmt_child + "\n")
+                    children.setdefault(mgmt_child, []).append(trace)
+                    continue
+            if len(found) == 0:  # target MAC not found on both devices
+                if device1 is not None:
+                    self.log("target MAC/device not present under these devices (" + trace.ip + ")")
+                continue
+            start = len(trace.path)
+            for dig in digs:  # the MAC found via ARP on the first tier is searched in the MAC table of the next ones
+                if trace.mac is None:
+                    trace.mac = dig.results.get(trace, (None, None))[0]
+                physical = dig.results.get(trace, (None, None))[1]
+                if physical is not None:
+                    names, counters = dig.interfaces[physical][3:5]
+                    trace.path.append((dig.ip, dig.hostname, names))
+                    trace.counters.update(((dig.ip, record.name), record) for record in counters)
+            if len(trace.path) > start:
+                trace.tiers.append(start)
+            if branches is True:
+                # every child is followed: the trace goes on the first one, a fork of it on the others
+                followed = []
+                for dig in digs:
+                    mgmt_child = dig.child(trace)
+                    if mgmt_child is None or mgmt_child in followed:
+                        continue
+                    followed.append(mgmt_child)
+                    branch = trace
+                    if len(followed) > 1:
+                        branch = trace.fork("\n" + str(datetime.now().time()) + " Branch of the path via " +
+                                            dig.hostname + "(" + dig.ip + ") towards " + mgmt_child + "\n")
+                    branch.via = [dig.via(trace)] if dig.via(trace) is not None else []
+                    children.setdefault(mgmt_child, []).append(branch)
+                if len(followed) == 0:
+                    trace.via = []
+                continue
+            # if one of the child is present, it will be the next starting point to dig further
+            mgmt_child = None
+            trace.via = []
+            for dig in digs:
+                if dig.child(trace) is not None:
+                    mgmt_child = dig.child(trace)
+                if dig.via(trace) is not None:
+                    trace.via.append(dig.via(trace))
+            if mgmt_child is not None:
+                children.setdefault(mgmt_child, []).append(trace)
+        return digs, children
+
+    def dig_cascade(self, ip, traces, combined=None, executor=None, first=True):
+        '''
+        :param ip: management IP (string) of the core, where L3 resides
+        :param traces: list of Trace objects, at the end each of them has the report of its path
+        :param combined: list where the text of every device is appended once (combined report), None if not needed
+        :param executor: same as dig_tier
+        :param first: False to start from a lower tier, with the MAC of the traces already known
+        :return: None
+        '''
+        # the cascades of the targets are dug together tier by tier: the targets that share a path share the devices
+        level = {ip: list(traces)}
+        visited = set()
+        hop = 0
+        while len(level) > 0:
+            next_level = {}
+            while len(level) > 0:
+                ip_device = next(iter(level))
+                traces_device = level.pop(ip_device)
+                if ip_device in visited:  # loop in the LLDP adjacencies, the targets can't be followed further
+                    for trace in traces_device:
+                        trace.report.append("\n" + str(datetime.now().time()) + " The path continues on " +
+                                            ip_device + ", already traced on another tier\n")
+                    continue
+                digs, children = self.dig_tier(ip_device, traces_device, first, level, executor)
+                visited.update(dig.ip for dig in digs)
+                if rpcProfile.profiler is not None:
+                    for dig in digs:
+                        rpcProfile.profiler.set_hop(dig.ip, hop)
+                if combined is not None:
+                    combined.extend(dig.combined_text() for dig in digs)
+                for mgmt_child, traces_child in children.items():
+                    next_level.setdefault(mgmt_child, []).extend(traces_child)
+            level = next_level
+            first = False
+            hop += 1
+
+    async def dig_graph(self, ip, traces, combined=None, executor=None, limit=4):
+        '''
+        :param ip: management IP (string) of the core, where L3 resides
+        :param traces: list of Trace objects, at the end each of them has the report of its path and of its branches
+        :param combined: same as dig_cascade, the devices are in the order of the branches
+        :param executor: same as dig_tier
+        :param limit: maximum number of tiers dug at the same time
+        :return: None
+        '''
+        # every child of every tier is followed, the tiers of one depth are dug at the same time, so the time depends
+        # on the depth of the path and not on the number of switches; the devices are assigned in the event loop in
+        # the order of the branches (the main path first), so the report doesn't depend on which thread is faster
+        import asyncio
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(limit)
+        pool = ThreadPoolExecutor(max_workers=limit)  # PyEZ is blocking, the tiers run in threads
+        claimed = {ip}  # devices already assigned to a tier
+        texts = []  # (branch path, list of texts of the tier) for the combined report
+        level = [((), ip, list(traces))]  # (branch path, mgmt IP, Trace objects) of the tiers of one depth, in order
+        first = True
 
+        async def run(function, *arguments):
+            async with semaphore:
+                return await loop.run_in_executor(pool, function, *arguments)
+
+        try:
+            while len(level) > 0:
+                # the ICCP peers are known before the tiers are dug: the two sides of a dual-homed switch reached by
+                # two branches are dug as one tier, by the first branch
+                peers = await asyncio.gather(*(run(self.resolve_peer, ip_device) for path, ip_device, t in level))
+                tiers = {ip_device: (path, traces_device, peer)
+                         for (path, ip_device, traces_device), peer in zip(level, peers)}
+                jobs = []
+                for ip_device in list(tiers):
+                    if ip_device not in tiers:  # merged in the tier of its ICCP peer
+                        continue
+                    path, traces_device, peer = tiers[ip_device]
+                    pending = {}
+                    if peer in tiers and peer != ip_device:
+                        pending[peer] = merge_forks(traces_device, tiers.pop(peer)[1])
+                    elif peer in claimed:
+                        peer = None  # dug by another branch
+                    if peer is not None:
+                        claimed.add(peer)
+                    jobs.append((path, run(self.dig_tier, ip_device, traces_device, first, pending, executor, True,
+                                           (True, peer))))
+                results = await asyncio.gather(*(job for path, job in jobs))
+                level = []
+                for (path, job), (digs, children) in zip(jobs, results):
+                    if rpcProfile.profiler is not None:
+                        for dig in digs:
+                            rpcProfile.profiler.set_hop(dig.ip, len(path))
+                    if combined is not None:
+                        texts.append((path, [dig.combined_text() for dig in digs]))
+                    for n, (mgmt_child, traces_child) in enumerate(children.items()):
+                        if mgmt_child in claimed:  # loop in the LLDP adjacencies or device reached by another branch
+                            for trace in traces_child:
+                                trace.report.append("\n" + str(datetime.now().time()) + " The path continues on " +
+                                                    mgmt_child + ", already traced in another branch\n")
+                            continue
+                        claimed.add(mgmt_child)
+                        level.append((path + (n,), mgmt_child, traces_child))
+                first = False
+        finally:
+            pool.shutdown()
+        if combined is not None:
+            for path, text in sorted(texts):
+                combined.extend(text)
+
+    def watch_device(self, ip, macs, interfaces):
+        '''
+        :param ip: management IP (string) of a device on a watched path
+        :param macs: MACs (string) whose location is checked
+        :param interfaces: interface names (string) whose counters are read
+        :return: tuple (dict MAC -> physical interface or None, tuple (time, dict interface -> InterfaceCounters)),
+                 None if it wasn't possible to connect
+        '''
+        device = self.acquire_device(ip, filtered=True)  # only the MAC table entry of the targets is asked
+        if device is None:
+            return None
         try:
-            device1.close()
-        except ConnectionError as error:
-            pprint(error)
+            located = {}
+            for mac in macs:
+                logical = get_macIndex(device, mac).get_interface(mac)
+                located[mac] = logical.split('.')[0] if logical is not None else None
+            return located, read_counters(device, interfaces)
+        finally:
+            self.close_device(device)
+
+    def rediscover(self, trace, tier):
+        '''
+        :param trace: Trace object whose target has moved
+        :param tier: index of the first tier (in trace.tiers) where the MAC isn't where it was
+        :return: None, the path of the trace is dug again from that tier, the upper tiers are kept
+        '''
+        start = trace.tiers[tier] if tier < len(trace.tiers) else len(trace.path)
+        probe = Trace(trace.ip)
+        if tier > 0 and start < len(trace.path):
+            probe.mac = trace.mac
+            self.dig_cascade(trace.path[start][0], [probe], None, self.executor, first=False)
+        else:
+            start, tier = 0, 0
+            # the target is searched again via ARP on the core
+            self.dig_cascade(self.core, [probe], None, self.executor)
+        trace.mac = probe.mac or trace.mac
+        trace.counters.update(probe.counters)
+        trace.path = trace.path[:start] + probe.path
+        trace.tiers = trace.tiers[:tier] + [start + n for n in probe.tiers]
+
+    def watch_paths(self, traces, interval, cycles, stream):
+        '''
+        :param traces: list of Trace objects already traced, their branches are watched too
+        :param interval: seconds between two cycles
+        :param cycles: number of cycles, 0 to watch until Ctrl-C
+        :param stream: file object where the changes are written as they are seen
+        :return: None; every cycle checks the MAC of the targets on the devices of their path and reads the counters
+                 of the path, the path is dug again only from the first tier where the MAC has moved
+        '''
+        def emit(line):
+            line = str(datetime.now().time()) + " " + line
+            if self.verbose is True:
+                print(line)
+            stream.write(line + "\n")
+            stream.flush()
+
+        watched = []
+        pending = list(traces)
+        while len(pending) > 0:
+            trace = pending.pop(0)
+            watched.append(trace)
+            pending.extend(trace.forks)
+        # the sessions stay open between the cycles
+        self.pool.idle_timeout = max(self.pool.idle_timeout, 2 * interval)
+        previous = {}  # (mgmt IP, interface) -> (time, array of the counters) of the last cycle
+        workers = ThreadPoolExecutor(max_workers=8)
+        start = time.monotonic()
+        cycle = 0
+        issued = rpc_stats['issued']
+        for trace in watched:
+            emit("Watching " + trace.ip + ": " + describe_path(trace.path))
         try:
-            device2.close()
-        except ConnectionError as error:
-            pprint(error)
-
-        txtfile.flush()
-    else:  # target MAC not found on both devices
-        device1.close()
-        pprint("target MAC/device not present under these devices")
-        exit_code = True
-txtfile.close()
+            while cycles == 0 or cycle < cycles:
+                time.sleep(max(0.0, start + cycle * interval - time.monotonic()))
+                cycle += 1
+                devices = {}  # mgmt IP -> (set of MACs, list of interfaces)
+                hostnames = {}
+                for trace in watched:
+                    for ip, hostname, names in trace.path:
+                        hostnames[ip] = hostname
+                        macs, interfaces = devices.setdefault(ip, (set(), []))
+                        macs.add(trace.mac)
+                        interfaces.extend(name for name in names if name not in interfaces)
+                results = dict(zip(devices, workers.map(lambda ip: self.watch_device(ip, *devices[ip]), devices)))
+
+                for trace in watched:
+                    moved = None
+                    for n, (ip, hostname, names) in enumerate(trace.path):
+                        if results.get(ip) is None:
+                            emit(trace.ip + ": " + hostname + "(" + ip + ") not reachable")
+                            break
+                        physical = results[ip][0].get(trace.mac)
+                        if physical != names[0]:
+                            emit(trace.ip + ": MAC " + str(trace.mac) + " moved on " + hostname + "(" + ip + "): " +
+                                 names[0] + " -> " + str(physical))
+                            moved = max(t for t, index in enumerate(trace.tiers) if index <= n)
+                            break
+                    if moved is None and len(trace.path) > 0:
+                        continue
+                    path = trace.path
+                    self.rediscover(trace, moved or 0)
+                    if trace.path != path:
+                        emit(trace.ip + ": path rediscovered: " + describe_path(trace.path))
+
+                for ip, result in results.items():
+                    if result is None:
+                        continue
+                    when, records = result[1]
+                    hostname = hostnames[ip]
+                    for name, record in records.items():
+                        counters = to_array(record)
+                        if (ip, name) in previous:
+                            before_time, before = previous[(ip, name)]
+                            for label, delta, rate in counter_changes(before, counters, when - before_time):
+                                emit(hostname + "(" + ip + ") " + name + " " + label + " " + "%+d" % delta + " (" +
+                                     "%.3f" % rate + "/s)")
+                        previous[(ip, name)] = (when, counters)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            workers.shutdown()
+        emit("Watch stopped after " + str(cycle) + " cycles, " + str(rpc_stats['issued'] - issued) + " RPC sent")
+
+    def sweep_neighbors(self, device, ip):
+        '''
+        :param device: jnpr.junos Device object
+        :param ip: management IP (string) of the device
+        :return: list of mgmt IPs of the ICCP peer and of the devices seen via LLDP, from the topology cache if
+                 enabled
+        '''
+        hit, peer = self.topology.get_peer(ip) if self.topology is not None else (False, None)
+        adjacent = [peer if hit is True else self.get_peerIP(device, ip)]
+        showlldp = get_snapshot(device).rpc('get_lldp_neighbors_information')
+        for neighbor in showlldp.iter('lldp-neighbor-information'):
+            interface = neighbor.findtext('lldp-local-port-id') or neighbor.findtext('lldp-local-interface')
+            if interface is not None:
+                adjacent.append(self.get_childIP(device, ip, interface.strip())[0])
+        return adjacent
+
+
+def trace_targets(core, targets, user=None, password=None, **options):
+    '''
+    :param core: management IP (string) of the core, where L3 resides
+    :param targets: list of target IPs (string)
+    :param user: username (string)
+    :param password: password (string), None for the SSH keys or for backends without credentials
+    :param options: other arguments of Cascade, e.g. backend, parallel, topology_cache, filtered, stream, verbose
+    :return: list of Trace objects of the targets, the sessions are closed before returning
+    '''
+    with Cascade(core, user, password, **options) as cascade:
+        return cascade.trace(targets)
+
+
+# functions end
+
+
+def build_parser():
+    '''
+    :return: argparse.ArgumentParser of the command line
+    '''
+    parser = argparse.ArgumentParser(description="Report of the interface errors in the path Core>target IP")
+    parser.add_argument('--filtered', action='store_true',
+                        help="ask the devices only the ARP/MAC entries and the ICCP config needed (server-side "
+                             "filters)")
+    parser.add_argument('--stream', action='store_true',
+                        help="look up one target in the ARP/MAC tables parsing the raw reply incrementally and "
+                             "stopping at its entry (not with --record)")
+    parser.add_argument('--parallel', action='store_true',
+                        help="handle the two ICCP peers of each tier at the same time")
+    parser.add_argument('--core', help="core management IP (asked if missing)")
+    parser.add_argument('--user', help="username (asked if missing)")
+    parser.add_argument('--targets', metavar='FILE',
+                        help="batch mode: file with one target IP per line ('-' for stdin) instead of asking one "
+                             "target")
+    parser.add_argument('--combined', action='store_true',
+                        help="batch mode: write one combined report instead of one report per target")
+    parser.add_argument('--topology-cache', metavar='FILE',
+                        help="JSON file where the ICCP/LLDP adjacencies are kept between runs")
+    parser.add_argument('--topology-ttl', type=int, default=DEFAULT_TTL, metavar='SECONDS',
+                        help="age after which a cached adjacency is discovered again (default a week)")
+    parser.add_argument('--refresh-topology', action='store_true',
+                        help="discover again every adjacency and rewrite the topology cache")
+    parser.add_argument('--record', metavar='DIR', help="save every RPC reply of the devices under DIR/<device IP>/")
+    backends = parser.add_mutually_exclusive_group()
+    backends.add_argument('--replay', metavar='DIR',
+                          help="don't connect to the devices, replay the replies saved in DIR")
+    backends.add_argument('--synthetic', metavar='SPEC',
+                          help="don't connect to the devices, generate a fabric, e.g. tiers=3,fanout=2,macs=10000,"
+                               "arp=10000,lacp=4,hosts=4,config=200 (its core is 10.0.0.1, its hosts 172.16.0.0 and "
+                               "following)")
+    parser.add_argument('--latency', type=float, default=0.0, metavar='SECONDS',
+                        help="with --replay/--synthetic, delay of every RPC")
+    parser.add_argument('--connect-latency', type=float, default=0.0, metavar='SECONDS',
+                        help="with --replay/--synthetic, delay of every connection")
+    parser.add_argument('--session-idle', type=int, default=DEFAULT_IDLE_TIMEOUT, metavar='SECONDS',
+                        help="close a pooled device session after it has been unused for SECONDS (default 300)")
+    parser.add_argument('--samples', type=int, default=0, metavar='N',
+                        help="after the trace, read N times the counters of the interfaces on the path and report the "
+                             "rates")
+    parser.add_argument('--interval', type=float, default=10.0, metavar='SECONDS',
+                        help="with --samples, seconds between two samples (default 10)")
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help="after the trace, keep the path and the sessions: every SECONDS check where the MAC of "
+                             "the targets is, dig again from the tier where it moved and write the counter changes")
+    parser.add_argument('--watch-cycles', type=int, default=0, metavar='N',
+                        help="with --watch, stop after N cycles (default: until Ctrl-C)")
+    parser.add_argument('--sweep', action='store_true',
+                        help="no target: walk every switch reachable from the core and rank the interfaces with most "
+                             "errors")
+    parser.add_argument('--sweep-workers', type=int, default=DEFAULT_WORKERS, metavar='N',
+                        help="with --sweep, switches collected at the same time (default 16)")
+    parser.add_argument('--top', type=int, default=50, metavar='N',
+                        help="with --sweep, interfaces in the ranking (default 50)")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="time every connection, RPC and parse, write them in FILE (JSON lines) and print a "
+                             "summary")
+    parser.add_argument('--all-branches', action='store_true',
+                        help="follow every child of every tier (dual-homed switches), the branches are dug "
+                             "concurrently")
+    parser.add_argument('--concurrency', type=int, default=4, metavar='N',
+                        help="with --all-branches, maximum number of tiers dug at the same time (default 4)")
+    parser.add_argument('--format', action='append', choices=sorted(SINKS), metavar='FORMAT',
+                        help="format of the reports: text, jsonl or csv, repeat it to write more than one (default "
+                             "text)")
+    return parser
+
+
+def main(argv=None):
+    '''
+    :param argv: list of the command line arguments, None for sys.argv
+    :return: None, or the text of the error that stopped the run (the reports are written anyway)
+    '''
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.samples == 1 or args.samples < 0:
+        parser.error("--samples needs at least 2 samples")
+    if args.targets == '-' and (args.core is None or args.user is None):
+        parser.error("--core and --user are needed when the targets are read from stdin")
+    formats = args.format or ['text']
+    if args.profile is not None:
+        rpcProfile.start_profile(args.profile)
+    backend = make_backend(args.replay, args.synthetic, args.record, args.latency, args.connect_latency)
+    if args.stream is True and backend.streams is False:
+        parser.error("--stream can't be used with --record, the recorded replies are the parsed ones")
+
+    timenow = str(datetime.now().strftime("%d-%m-%Y %H-%M-%S"))
+    timestart = str(datetime.now().time())
+    if args.targets is not None:
+        targets = read_targets(args.targets)
+    core = args.core if args.core is not None else input("Insert your core management IP: ")
+    user = args.user if args.user is not None else input("Username: ")
+    password = getpass("Password: ") if backend.needs_credentials is True else None
+    if args.sweep is True:
+        targets = []
+    elif args.targets is None:
+        targets = [input("Insert target IP: ")]
+    traces = [Trace(target) for target in targets]
+    combined = [] if args.combined is True else None
+
+    cascade = Cascade(core, user, password, backend, args.parallel, args.all_branches, args.concurrency,
+                      args.topology_cache, args.topology_ttl, args.refresh_topology, args.session_idle, args.filtered,
+                      args.stream)
+    error = None
+    sampled = {}  # Trace -> text of the counter sampling, written after the path and its branches
+    swept = None
+    try:
+        if args.sweep is True:
+            swept = cascade.sweep(args.sweep_workers)
+        else:
+            cascade.trace(traces, combined)
+        if args.samples > 0:
+            samples = cascade.sample(traces, args.samples, args.interval)
+            for trace in traces:
+                sampled[trace] = samples.render(trace.full_path())
+            if combined is not None:
+                combined.append(samples.render())
+        if args.watch is not None:
+            with open("Watch " + timenow + ".txt", "w") as stream:
+                cascade.watch_paths(traces, args.watch, args.watch_cycles, stream)
+    except Exception as exception:
+        error = "Undefined Error: " + str(exception)  # the reports are written anyway with what has been found
+    finally:
+        cascade.close()
+        pprint(cascade.pool.summary())
+        if cascade.topology is not None:
+            pprint(cascade.topology.summary())
+
+    pprint(rpc_summary())
+    sizes = bytes_summary()  # only in filtered mode or with the profile
+    if sizes != "":
+        print(sizes)
+    if rpcProfile.profiler is not None:
+        rpcProfile.profiler.close()
+        print(rpcProfile.profiler.summary())
+    summary = "\n" + str(datetime.now().time()) + " " + rpc_summary() + "\n" + (sizes + "\n" if sizes != "" else "")
+    # every report is written through its sinks, one per format, and flushed once when closed
+    if swept is not None:
+        print(swept.render(args.top))
+        for sink in open_sinks(formats, "Sweep " + timenow):
+            with sink:
+                sink.text(timestart + " SWEEP starting from " + core + "\n")
+                sink.sweep(swept, args.top)
+                sink.text(summary)
+    elif combined is not None:
+        for sink in open_sinks(formats, "Report batch " + timenow):
+            with sink:
+                sink.text(timestart + " REPORT IPs " + ", ".join(targets) + " starting from " + core + "\n")
+                for trace in traces:
+                    sink.trace(trace)
+                sink.text("".join(combined) + summary)
+    else:
+        for trace in traces:
+            if len(traces) == 1:
+                name = "Report " + timenow  # file named with the hour
+            else:
+                name = "Report " + trace.ip + " " + timenow
+            for sink in open_sinks(formats, name):
+                with sink:
+                    sink.text(timestart + " REPORT IP " + trace.ip + " starting from " + core + "\n")
+                    sink.trace(trace)
+                    sink.text(trace.text() + sampled.get(trace, "") + summary)
+    return error
+
+
+if __name__ == '__main__':
+    sys.exit(main())
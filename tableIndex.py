@@ -0,0 +1,157 @@
+'''
+Hash indexes of the ARP and ethernet-switching tables.
+
+Each table reply is walked once and turned into dictionaries, so every following lookup (IP->MAC, MAC->interface,
+interface->MACs) costs O(1) instead of a scan of the whole XML tree.
+The indexes are kept in the device snapshot, so they are built at most once per hop.
+In filtered mode the index is built from the reply scoped on the searched IP/MAC, so it holds only that entry.
+In stream mode a single lookup parses the raw reply incrementally and stops at the searched entry, the index holds
+only that entry and the memory used doesn't depend on the size of the table.
+'''
+
+from lxml import etree
+from rpcSnapshot import get_snapshot
+
+
+class MacTable:
+    '''
+    Index of an ethernet-switching table reply
+    '''
+    __slots__ = ('by_mac', 'by_interface')
+
+    def __init__(self):
+        self.by_mac = {}  # MAC -> logical interface (first entry seen, as the table scan did)
+        self.by_interface = {}  # physical interface -> list of MACs learned on it
+
+    def get_interface(self, mac):
+        '''
+        :param mac: MAC (string)
+        :return: logical interface (string) where the MAC is learned, None if the MAC is not in the table
+        '''
+        return self.by_mac.get(mac)
+
+    def get_macs(self, interface):
+        '''
+        :param interface: physical interface (string)
+        :return: list of MACs learned on the interface
+        '''
+        return self.by_interface.get(interface, [])
+
+
+def build_arpIndex(showArp):
+    '''
+    :param showArp: reply of get_arp_table_information
+    :return: dict IP -> MAC (string), if an IP is present more than once the last entry wins
+    '''
+    arp = {}
+    for i in showArp.iter('arp-table-entry'):
+        arp[i.findtext('ip-address')] = i.findtext('mac-address')
+    return arp
+
+
+def build_macIndex(showmac):
+    '''
+    :param showmac: reply of get_ethernet_switching_table_information
+    :return: MacTable object
+    '''
+    table = MacTable()
+    by_mac = table.by_mac
+    by_interface = table.by_interface
+    for p in showmac.iter('l2ng-mac-entry'):
+        mac = p.findtext('l2ng-l2-mac-address')
+        logical = p.findtext('l2ng-l2-mac-logical-interface')
+        if mac is None or logical is None:
+            continue
+        if mac not in by_mac:
+            by_mac[mac] = logical
+        physical = logical.split('.')[0]
+        if physical in by_interface:
+            by_interface[physical].append(mac)
+        else:
+            by_interface[physical] = [mac]
+    return table
+
+
+def _stream_entries(source, tag):
+    '''
+    :param source: file object with a raw XML reply
+    :param tag: tag (string) of the table entries
+    :return: generator of the entry elements, each one is cleared and dropped from the tree once the next is parsed,
+             so at most one entry is in memory; closing the generator stops the parsing. The raw replies of the real
+             devices keep the Junos namespaces, the tags are matched in any namespace ({*})
+    '''
+    for event, entry in etree.iterparse(source, events=('end',), tag='{*}' + tag):
+        yield entry
+        entry.clear()
+        while entry.getprevious() is not None:
+            del entry.getparent()[0]
+
+
+def stream_arpIndex(source, target):
+    '''
+    :param source: file object with the raw reply of get_arp_table_information
+    :param target: IP (string) searched
+    :return: dict IP -> MAC with only the first entry of the target (empty if the IP is not in the table)
+    '''
+    for entry in _stream_entries(source, 'arp-table-entry'):
+        if (entry.findtext('{*}ip-address') or '').strip() == target:
+            return {target: (entry.findtext('{*}mac-address') or '').strip()}
+    return {}
+
+
+def stream_macIndex(source, mac):
+    '''
+    :param source: file object with the raw reply of get_ethernet_switching_table_information
+    :param mac: MAC (string) searched
+    :return: MacTable object with only the first entry of the MAC (empty if the MAC is not in the table)
+    '''
+    table = MacTable()
+    for entry in _stream_entries(source, 'l2ng-mac-entry'):
+        if (entry.findtext('{*}l2ng-l2-mac-address') or '').strip() == mac:
+            logical = (entry.findtext('{*}l2ng-l2-mac-logical-interface') or '').strip()
+            table.by_mac[mac] = logical
+            table.by_interface[logical.split('.')[0]] = [mac]
+            break
+    return table
+
+
+def get_arpIndex(device, target=None):
+    '''
+    :param device: jnpr.junos Device object
+    :param target: IP (string) that is going to be searched, used to ask the device only its entry in filtered mode
+    :return: dict IP -> MAC of the device, built from the ARP table at most once per hop
+    '''
+    snapshot = get_snapshot(device)
+    if 'arp' in snapshot.indexes:  # the full table is already parsed on this hop, no rpc and no second index
+        return snapshot.indexes['arp']
+    if target is not None and snapshot.streaming is True and snapshot.filtered is False:
+        arp = snapshot.index(('arp stream', target), lambda: snapshot.stream(
+            'get_arp_table_information', lambda raw: stream_arpIndex(raw, target), no_resolve=True))
+        if arp is not None:
+            return arp
+    if target is None or snapshot.filtered is False:
+        return snapshot.index('arp', lambda: snapshot.parse(
+            'arp', build_arpIndex, snapshot.rpc('get_arp_table_information', no_resolve=True)))
+    showArp = snapshot.filtered_rpc('get_arp_table_information', {'hostname': target}, no_resolve=True)
+    return snapshot.index(('arp', id(showArp)), lambda: snapshot.parse('arp', build_arpIndex, showArp))
+
+
+def get_macIndex(device, mac=None):
+    '''
+    :param device: jnpr.junos Device object
+    :param mac: MAC (string) that is going to be searched, used to ask the device only its entry in filtered mode
+    :return: MacTable of the device, built from the ethernet-switching table at most once per hop
+    '''
+    snapshot = get_snapshot(device)
+    if 'mac' in snapshot.indexes:  # the full table is already parsed on this hop, no rpc and no second index
+        return snapshot.indexes['mac']
+    if mac is not None and snapshot.streaming is True and snapshot.filtered is False:
+        table = snapshot.index(('mac stream', mac), lambda: snapshot.stream(
+            'get_ethernet_switching_table_information', lambda raw: stream_macIndex(raw, mac)))
+        if table is not None:
+            return table
+    if mac is None or snapshot.filtered is False:
+        return snapshot.index('mac', lambda: snapshot.parse(
+            'mac', build_macIndex, snapshot.rpc('get_ethernet_switching_table_information')))
+    showmac = snapshot.filtered_rpc('get_ethernet_switching_table_information', {'address': mac})
+    return snapshot.index(('mac', id(showmac)), lambda: snapshot.parse('mac', build_macIndex, showmac))
@@ -0,0 +1,117 @@
+'''
+On-disk cache of the fabric adjacencies: device -> ICCP peer and (device, interface) -> mgmt IP of the child seen via
+LLDP.
+
+The topology changes rarely, so a run can skip the discovery RPCs (get_config for ICCP, LLDP neighbors) of the
+adjacencies already known and open the connections to the next tier in advance. Each entry has its own timestamp and
+is ignored once older than the TTL; with refresh=True every entry is rediscovered (and saved again).
+The file is a compact JSON document:
+    {"peers": {"<device ip>": [<peer ip or null>, <epoch>]},
+     "children": {"<device ip> <interface>": [<child ip or null>, <epoch>]}}
+'''
+
+import json
+import os
+import threading
+import time
+
+DEFAULT_TTL = 7 * 24 * 3600  # a week
+
+
+class TopologyCache:
+    '''
+    Adjacencies of the fabric with a TTL per entry
+    '''
+
+    def __init__(self, path, ttl=DEFAULT_TTL, refresh=False):
+        '''
+        :param path: path (string) of the JSON file, created by save() if it doesn't exist
+        :param ttl: seconds after which an entry has to be discovered again
+        :param refresh: if True the cached entries are never used, but the discovered ones are saved
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.refresh = refresh
+        self.peers = {}
+        self.children = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # the peers of a tier can be handled by different threads
+        if os.path.exists(path):
+            with open(path) as file:
+                data = json.load(file)
+            self.peers = data.get('peers', {})
+            self.children = data.get('children', {})
+
+    def _get(self, entries, key):
+        '''
+        :return: tuple (hit, value), hit is False if the entry is missing, expired or a refresh is forced
+        '''
+        with self._lock:
+            entry = entries.get(key)
+            if self.refresh is True or entry is None or time.time() - entry[1] > self.ttl:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[0]
+
+    def _set(self, entries, key, value):
+        with self._lock:
+            entries[key] = [value, int(time.time())]
+
+    def get_peer(self, ip):
+        '''
+        :param ip: management IP (string) of the device
+        :return: tuple (hit, peer IP), the peer IP is None if the device has no ICCP peer
+        '''
+        return self._get(self.peers, ip)
+
+    def set_peer(self, ip, peer):
+        '''
+        :param ip: management IP (string) of the device
+        :param peer: management IP (string) of the ICCP peer, None if there isn't one
+        '''
+        self._set(self.peers, ip, peer)
+
+    def get_child(self, ip, interface):
+        '''
+        :param ip: management IP (string) of the device
+        :param interface: interface (string) where LLDP is looked
+        :return: tuple (hit, child IP), the child IP is None if no device is seen on the interface
+        '''
+        return self._get(self.children, ip + " " + interface)
+
+    def set_child(self, ip, interface, child):
+        '''
+        :param ip: management IP (string) of the device
+        :param interface: interface (string) where LLDP is looked
+        :param child: management IP (string) of the device seen via LLDP, None if there isn't one
+        '''
+        self._set(self.children, ip + " " + interface, child)
+
+    def forget_child(self, ip, interface):
+        '''
+        :param ip: management IP (string) of the device
+        :param interface: interface (string)
+        :return: None, the entry is dropped (e.g. because the MAC lookups disagree with it)
+        '''
+        with self._lock:
+            self.children.pop(ip + " " + interface, None)
+
+    def save(self):
+        '''
+        :return: None, the cache is written on the file (through a temporary file, so a crash can't truncate it)
+        '''
+        with self._lock:
+            data = {'peers': self.peers, 'children': self.children}
+        temporary = self.path + ".tmp"
+        with open(temporary, 'w') as file:
+            json.dump(data, file, separators=(',', ':'), sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def summary(self):
+        '''
+        :return: string with the number of adjacencies served from the cache and discovered on the devices
+        '''
+        return ("Topology cache: " + str(self.hits) + " adjacencies from cache, " + str(self.misses) +
+                " discovered on the devices")